@@ -0,0 +1,17 @@
+﻿"""Benchmarks de la app (se corren desde la raíz del repo: python -m bench.<nombre>)."""
+import math, statistics
+
+
+def summarize(values):
+    """min / mediana / máx en ms (redondeados) de una lista de mediciones en ms."""
+    values = sorted(values)
+    return {"min": round(values[0], 2), "median": round(statistics.median(values), 2),
+            "max": round(values[-1], 2), "n": len(values)}
+
+
+def percentile(sorted_values, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
@@ -0,0 +1,284 @@
+﻿"""Carga HTTP sobre main:app: in-process (ASGI) y por socket (uvicorn local).
+
+Por cada tamaño de dataset se siembra una DB (copia de una semilla cacheada en
+el directorio temporal) y se corre cada escenario con N requests y C clientes
+concurrentes. Reporta p50/p95/p99 (ms), requests/s, errores y RSS pico del
+proceso que sirve la app, todo en JSON.
+
+Uso:
+    python -m bench.load                                  # 1k filas, asgi + socket
+    python -m bench.load --rows 1k,100k,1M --concurrency 32 --requests 500
+    python -m bench.load --modes asgi --scenarios home,registros,export_csv
+    python -m bench.load --save-baseline bench/baseline.json
+    python -m bench.load --baseline bench/baseline.json   # exit 1 si hay regresiones
+
+Requiere httpx (y uvicorn para --modes socket).
+"""
+import argparse, asyncio, json, os, platform, shutil, socket, subprocess, sys, tempfile, time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from bench import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+ADMIN_KEY = "bench-admin"
+
+# (nombre, método, ruta, pesado): los pesados usan --export-requests en vez de --requests
+SCENARIOS = [
+    ("home", "GET", "/", False),
+    ("registro_form", "GET", "/registro", False),
+    ("registro_post", "POST", "/registro", False),
+    ("registros", "GET", "/registros?limit=50", False),
+    ("health", "GET", "/health", False),
+    ("export_csv", "GET", "/export/csv", True),
+    ("export_json", "GET", "/export/json", True),
+    ("admin_db_count", "GET", "/admin/db-count", False),
+    ("admin_counts", "GET", "/admin/counts", False),
+    ("admin_stats", "GET", "/admin/stats?bucket=day&group_by=ciudad", False),
+    ("admin_search", "GET", "/admin/search?q=maria", False),
+    ("admin_fix_list", "GET", "/admin/fix/list", False),
+    ("admin_db_writer", "GET", "/admin/db-writer", False),
+    ("admin_metrics", "GET", "/admin/metrics", False),
+]
+
+
+def parse_rows(text):
+    out = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        mult = {"k": 1_000, "m": 1_000_000}.get(part[-1:], 1)
+        out.append(int(float(part.rstrip("km")) * mult))
+    return out
+
+
+# --- datos ---
+def seed(rows, cache_dir, seed_value=0):
+    """DB semilla con `rows` filas de datagen (cacheada por tamaño, semilla y versión del esquema)."""
+    import datagen, migrations
+    path = Path(cache_dir) / f"seed-v{migrations.MIGRATIONS[-1][0]}-s{seed_value}-{rows}.db"
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+    datagen.load_sqlite(tmp, datagen.generate(rows, seed_value))
+    os.replace(tmp, path)
+    return path
+
+
+def prepare(seed_path):
+    base = Path(tempfile.mkdtemp(prefix="starlinx-bench-"))
+    shutil.copyfile(seed_path, base / "starlinx.db")
+    return base
+
+
+def app_env(base):
+    return {**os.environ, "STARLINX_BASE_DIR": str(base), "ADMIN_KEY": ADMIN_KEY}
+
+
+# --- carga ---
+async def run_scenario(client, scenario, requests, concurrency, warmup):
+    name, method, path, _ = scenario
+    headers = {"X-Admin-Key": ADMIN_KEY} if path.startswith("/admin/") else {}
+
+    async def call(i):
+        if method == "POST":
+            data = {"nombre": f"Bench {i}", "documento": str(90_000_000 + i), "telefono": "3000000000"}
+            return await client.post(path, data=data, headers=headers)
+        return await client.get(path, headers=headers)
+
+    for i in range(warmup):
+        await call(-1 - i)
+    latencies, errors, nbytes = [], 0, 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, nbytes
+        for i in counter:
+            t = time.perf_counter()
+            try:
+                r = await call(i)
+                nbytes += len(r.content)
+                if r.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / wall, 2),
+            "p50_ms": round(percentile(latencies, 50), 3), "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3), "bytes_per_request": nbytes // max(len(latencies), 1)}
+
+
+async def run_all(client, cfg):
+    out = {}
+    for sc in SCENARIOS:
+        if cfg["scenarios"] and sc[0] not in cfg["scenarios"]:
+            continue
+        n = cfg["export_requests"] if sc[3] else cfg["requests"]
+        out[sc[0]] = await run_scenario(client, sc, n, cfg["concurrency"], cfg["warmup"])
+    return out
+
+
+def _peak_rss_self_mb():
+    import resource
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # macOS: bytes
+
+
+def _peak_rss_pid_mb(pid):
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def _asgi_worker(cfg):
+    # se corre en un proceso propio: main lee STARLINX_BASE_DIR al importarse
+    import httpx
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            scenarios = await run_all(client, cfg)
+    return {"scenarios": scenarios, "peak_rss_mb": _peak_rss_self_mb()}
+
+
+def run_asgi(base, cfg):
+    out = subprocess.run([sys.executable, "-m", "bench.load", "--worker", json.dumps(cfg)], cwd=ROOT,
+                         env=app_env(base), capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"worker asgi falló:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@contextmanager
+def server(base, args, timeout=120.0):
+    """Lanza `python <args>` con la app sobre `base` en un puerto libre; entrega (url, proceso) al responder /health."""
+    import httpx
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, *args, "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning"], cwd=ROOT, env=app_env(base))
+    url = f"http://127.0.0.1:{port}"
+    try:
+        t0 = time.perf_counter()
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{args[0]} terminó con código {proc.returncode}")
+            try:
+                if httpx.get(url + "/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                if time.perf_counter() - t0 > timeout:
+                    raise TimeoutError(f"{args[0]} no respondió en {timeout}s")
+                time.sleep(0.05)
+        yield url, proc
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+def run_socket(base, cfg):
+    import httpx
+    with server(base, ["-m", "uvicorn", "main:app"]) as (url, proc):
+        async def go():
+            limits = httpx.Limits(max_connections=cfg["concurrency"], max_keepalive_connections=cfg["concurrency"])
+            async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+                return await run_all(client, cfg)
+        scenarios = asyncio.run(go())
+        return {"scenarios": scenarios, "peak_rss_mb": _peak_rss_pid_mb(proc.pid)}
+
+
+# --- baseline ---
+def compare(current, baseline, tolerance, floor_ms=1.0):
+    """Lista de regresiones: p95 y RSS más altos o RPS más bajos que la baseline más la tolerancia."""
+    regressions = []
+    for mode, by_rows in current["results"].items():
+        for rows, res in by_rows.items():
+            base = baseline.get("results", {}).get(mode, {}).get(rows)
+            if not base:
+                continue
+            for name, cur in res["scenarios"].items():
+                ref = base["scenarios"].get(name)
+                if not ref:
+                    continue
+                key = f"{mode}/{rows}/{name}"
+                if cur["p95_ms"] > ref["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - ref["p95_ms"] > floor_ms:
+                    regressions.append(f"{key}: p95 {ref['p95_ms']} -> {cur['p95_ms']} ms")
+                if cur["rps"] < ref["rps"] * (1 - tolerance):
+                    regressions.append(f"{key}: rps {ref['rps']} -> {cur['rps']}")
+                if cur["errors"] > ref["errors"]:
+                    regressions.append(f"{key}: errores {ref['errors']} -> {cur['errors']}")
+            if res.get("peak_rss_mb") and base.get("peak_rss_mb") and \
+                    res["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(f"{mode}/{rows}: RSS pico {base['peak_rss_mb']} -> {res['peak_rss_mb']} MB")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", default="1k", help="tamaños de dataset, p. ej. 1k,100k,1M")
+    ap.add_argument("--modes", default="asgi,socket", help="asgi y/o socket")
+    ap.add_argument("--scenarios", default="", help="subconjunto separado por comas (default: todos)")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=400, help="requests por escenario")
+    ap.add_argument("--export-requests", type=int, default=10, help="requests por escenario de exportación")
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=0, help="semilla de datagen")
+    ap.add_argument("--cache-dir", default=str(Path(tempfile.gettempdir()) / "starlinx-bench-seeds"))
+    ap.add_argument("--out", help="guardar el JSON de resultados")
+    ap.add_argument("--save-baseline", help="guardar los resultados como baseline")
+    ap.add_argument("--baseline", help="comparar contra esta baseline (exit 1 si hay regresiones)")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(asyncio.run(_asgi_worker(json.loads(args.worker)))))
+        return 0
+
+    cfg = {"concurrency": args.concurrency, "requests": args.requests, "export_requests": args.export_requests,
+           "warmup": args.warmup, "seed": args.seed,
+           "scenarios": [s.strip() for s in args.scenarios.split(",") if s.strip()]}
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    report = {"meta": {"python": sys.version.split()[0], "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "date": datetime.now().isoformat(timespec="seconds"), **cfg},
+              "results": {m: {} for m in modes}}
+    for rows in parse_rows(args.rows):
+        seed_path = seed(rows, args.cache_dir, args.seed)
+        for mode in modes:
+            base = prepare(seed_path)
+            try:
+                print(f"[bench] {mode} {rows} filas...", file=sys.stderr)
+                res = run_asgi(base, cfg) if mode == "asgi" else run_socket(base, cfg)
+                report["results"][mode][str(rows)] = res
+            finally:
+                shutil.rmtree(base, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.out, args.save_baseline):
+        if path:
+            Path(path).write_text(text + "\n", encoding="utf-8")
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        for r in regressions:
+            print(f"[REGRESIÓN] {r}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("[bench] sin regresiones contra la baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
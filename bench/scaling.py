@@ -0,0 +1,149 @@
+﻿"""Escalado por workers: mismo dataset y misma carga contra serve.py con 1..N workers.
+
+Para que el cliente no sea el cuello de botella, la carga de cada escenario la
+generan --clients procesos a la vez (cada uno con concurrency/clients
+conexiones). Reporta req/s y p50/p95/p99 por cantidad de workers, el speedup
+contra 1 worker y la RSS sumada de todos los procesos del servidor, en JSON.
+
+Uso:
+    python -m bench.scaling                               # 1, 2, 4, ... hasta los núcleos
+    python -m bench.scaling --workers 1,2,4,8 --rows 100k --scenarios home,registros,registro_post
+
+Con un solo núcleo no hay escalado que medir: los números sólo muestran el costo
+de tener más procesos. Requiere httpx y uvicorn.
+"""
+import argparse, asyncio, json, os, platform, shutil, subprocess, sys, tempfile
+from datetime import datetime
+from pathlib import Path
+
+from bench import load
+
+DEFAULT_SCENARIOS = "home,registros,registro_post,admin_counts,export_json"
+
+
+def parse_workers(text, cpus):
+    if text:
+        return sorted({max(1, int(w)) for w in text.split(",") if w.strip()})
+    out, n = [], 1
+    while n < cpus:
+        out.append(n)
+        n *= 2
+    return out + [cpus]
+
+
+def _tree_rss_mb(pid):
+    """RSS actual sumada de pid y sus descendientes (Linux /proc; None en otros sistemas)."""
+    proc = Path("/proc")
+    if not proc.exists():
+        return None
+    children = {}
+    for d in proc.iterdir():
+        if d.name.isdigit():
+            try:
+                ppid = int((d / "stat").read_text().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(d.name))
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        stack.extend(children.get(p, ()))
+        try:
+            for line in (proc / str(p) / "status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+        except OSError:
+            pass
+    return round(total / 1024, 1)
+
+
+# --- clientes ---
+async def _client(url, scenario, cfg):
+    import httpx
+    limits = httpx.Limits(max_connections=cfg["concurrency"], max_keepalive_connections=cfg["concurrency"])
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        return await load.run_scenario(client, scenario, cfg["requests"], cfg["concurrency"], cfg["warmup"])
+
+
+def run_clients(url, scenario, cfg, clients):
+    """El escenario desde `clients` procesos en paralelo; req/s = total / el más lento."""
+    share = {**cfg, "concurrency": max(1, cfg["concurrency"] // clients),
+             "requests": max(1, cfg["requests"] // clients)}
+    procs = [subprocess.Popen([sys.executable, "-m", "bench.scaling", "--client",
+                               json.dumps({"url": url, "scenario": scenario, "cfg": share})],
+                              cwd=load.ROOT, stdout=subprocess.PIPE, text=True) for _ in range(clients)]
+    parts = []
+    for p in procs:
+        out, _ = p.communicate()
+        if p.returncode != 0:
+            raise RuntimeError(f"cliente de {scenario[0]} terminó con código {p.returncode}")
+        parts.append(json.loads(out.strip().splitlines()[-1]))
+    n = sum(r["requests"] for r in parts)
+    wall = max(r["requests"] / r["rps"] for r in parts if r["rps"])
+    # percentiles: el peor de los clientes (no se juntan las muestras)
+    return {"requests": n, "errors": sum(r["errors"] for r in parts), "rps": round(n / wall, 2),
+            **{k: max(r[k] for r in parts) for k in ("p50_ms", "p95_ms", "p99_ms")}}
+
+
+def run_workers(base, workers, cfg, clients):
+    with load.server(base, ["serve.py", "--workers", str(workers)]) as (url, proc):
+        out = {}
+        for sc in load.SCENARIOS:
+            if sc[0] in cfg["scenarios"]:
+                n = cfg["export_requests"] if sc[3] else cfg["requests"]
+                out[sc[0]] = run_clients(url, sc, {**cfg, "requests": n}, clients)
+        return {"scenarios": out, "rss_mb": _tree_rss_mb(proc.pid)}
+
+
+def main(argv=None):
+    cpus = os.cpu_count() or 1
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", default="", help="p. ej. 1,2,4 (default: potencias de 2 hasta los núcleos)")
+    ap.add_argument("--rows", default="100k", help="tamaño del dataset (1k, 100k, 1M)")
+    ap.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    ap.add_argument("--clients", type=int, default=min(4, cpus), help="procesos generando carga")
+    ap.add_argument("--concurrency", type=int, default=64, help="conexiones en total (repartidas entre clientes)")
+    ap.add_argument("--requests", type=int, default=2000, help="requests por escenario (en total)")
+    ap.add_argument("--export-requests", type=int, default=40)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cache-dir", default=str(Path(tempfile.gettempdir()) / "starlinx-bench-seeds"))
+    ap.add_argument("--out", help="guardar el JSON de resultados")
+    ap.add_argument("--client", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.client:
+        job = json.loads(args.client)
+        print(json.dumps(asyncio.run(_client(job["url"], tuple(job["scenario"]), job["cfg"]))))
+        return 0
+
+    rows = load.parse_rows(args.rows)[0]
+    clients = max(1, args.clients)
+    cfg = {"concurrency": args.concurrency, "requests": args.requests, "export_requests": args.export_requests,
+           "warmup": args.warmup, "scenarios": [s.strip() for s in args.scenarios.split(",") if s.strip()]}
+    report = {"meta": {"python": sys.version.split()[0], "platform": platform.platform(), "cpus": cpus,
+                       "date": datetime.now().isoformat(timespec="seconds"), "rows": rows, "clients": clients,
+                       "seed": args.seed, **cfg},
+              "results": {}, "speedup": {}}
+    seed_path = load.seed(rows, args.cache_dir, args.seed)
+    for w in parse_workers(args.workers, cpus):
+        base = load.prepare(seed_path)  # DB fresca por corrida: los POST no se acumulan
+        try:
+            print(f"[bench] {w} worker(s), {rows} filas...", file=sys.stderr)
+            report["results"][str(w)] = run_workers(base, w, cfg, clients)
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
+    ref = next(iter(report["results"].values()))["scenarios"]
+    for name, r in ref.items():
+        report["speedup"][name] = {w: round(res["scenarios"][name]["rps"] / r["rps"], 2) if r["rps"] else None
+                                   for w, res in report["results"].items()}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+﻿"""Arranque en frío: import de main, lifespan y tiempo hasta la primera respuesta.
+
+Cada corrida usa un intérprete nuevo, con la DB y data/ en una carpeta temporal
+(STARLINX_BASE_DIR) migrada una vez antes de medir. Mide:
+  - in-process: import_ms, lifespan_ms y first_response_ms (GET /health por ASGI directo)
+  - socket:     spawn_to_first_response_ms (uvicorn desde el exec hasta el primer 200)
+
+Uso:
+    python -m bench.startup                   # 5 corridas, in-process + uvicorn
+    python -m bench.startup --runs 10 --json
+    python -m bench.startup --no-server       # sin uvicorn
+    python -m bench.startup --importtime      # los imports más lentos (python -X importtime)
+    python -m bench.startup --budget-ms 800   # exit 1 si la mediana supera el presupuesto
+"""
+import argparse, json, os, shutil, socket, subprocess, sys, tempfile, time, urllib.request
+from pathlib import Path
+
+from bench import summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_PROBE = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def run():
+    sent = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(msg):
+        sent.append(msg)
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/health", "raw_path": b"/health", "root_path": "",
+             "query_string": b"", "headers": [(b"host", b"bench")],
+             "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        await main.app(scope, receive, send)
+        t3 = time.perf_counter()
+    return t2, t3, sent[0]["status"]
+
+t2, t3, status = asyncio.run(run())
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "lifespan_ms": (t2 - t1) * 1000,
+                  "first_response_ms": (t3 - t2) * 1000, "total_ms": (t3 - t0) * 1000, "status": status}))
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def app_env(base):
+    # main lee STARLINX_BASE_DIR al importarse: nada de starlinx.db ni data/ en el repo
+    return {**os.environ, "STARLINX_BASE_DIR": str(base)}
+
+
+def in_process(env):
+    out = subprocess.run([sys.executable, "-c", _PROBE], cwd=ROOT, env=env, capture_output=True, text=True,
+                         check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def server(env, timeout=30.0):
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                             "--log-level", "warning"], cwd=ROOT, env=env)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn terminó con código {proc.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as r:
+                    if r.status == 200:
+                        return {"spawn_to_first_response_ms": (time.perf_counter() - t0) * 1000}
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"sin respuesta de {url} en {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def importtime(env, top=15):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[12:]:
+            continue
+        self_us, cum_us, name = (p.strip() for p in line[12:].split("|"))
+        if self_us.isdigit():
+            rows.append((int(cum_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": n, "cumulative_ms": round(c / 1000, 2), "self_ms": round(s / 1000, 2)}
+            for c, s, n in rows[:top]]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--no-server", action="store_true", help="no medir con uvicorn")
+    ap.add_argument("--importtime", action="store_true")
+    ap.add_argument("--budget-ms", type=float, help="máximo para la mediana hasta la primera respuesta")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+
+    base = Path(tempfile.mkdtemp(prefix="starlinx-startup-"))
+    env = app_env(base)
+    try:
+        in_process(env)  # crea y migra la DB: las corridas medidas arrancan sobre una base ya hecha
+        samples = {}
+        for _ in range(args.runs):
+            runs = [in_process(env)] + ([] if args.no_server else [server(env)])
+            for r in runs:
+                for k, v in r.items():
+                    if k.endswith("_ms"):
+                        samples.setdefault(k, []).append(v)
+        report = {"python": sys.version.split()[0], "runs": args.runs,
+                  "metrics": {k: summarize(v) for k, v in samples.items()}}
+        if args.importtime:
+            report["slowest_imports"] = importtime(env)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    key = "total_ms" if args.no_server else "spawn_to_first_response_ms"
+    ok = args.budget_ms is None or report["metrics"][key]["median"] <= args.budget_ms
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for k, s in report["metrics"].items():
+            print(f"{k:30s} median {s['median']:9.2f} ms   min {s['min']:9.2f}   max {s['max']:9.2f}")
+        for r in report.get("slowest_imports", []):
+            print(f"  {r['module']:40s} {r['cumulative_ms']:8.2f} ms (propio {r['self_ms']:.2f})")
+        if args.budget_ms is not None:
+            print(f"{key}: {'OK' if ok else 'EXCEDIDO'} (presupuesto {args.budget_ms} ms)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+﻿"""Hub de difusión en proceso para Server-Sent Events (/admin/stream).
+
+Una tarea por proceso (feed) sigue la tabla desde la DB: así cada worker ve lo
+que confirman los demás, no sólo su propio writer. Sin suscriptores sólo sigue
+el último id. Cada evento se serializa una sola vez y se reparte a las colas
+(acotadas) de los suscriptores en el loop de asyncio. Un suscriptor que no alcanza a vaciar su cola se desconecta (el
+navegador reconecta con Last-Event-ID) en vez de frenar al resto o crecer sin límite.
+"""
+import asyncio, json, sys
+
+
+def sse(event_id, data, event="registro"):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    def __init__(self, size):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.evicted = False
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Hub:
+    def __init__(self, buffer=256):
+        self.buffer = int(buffer)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._subs: set[Subscriber] = set()
+        self._wake: asyncio.Event | None = None
+        self.published = self.delivered = self.evictions = self.errors = 0
+
+    def bind(self, loop):
+        self._loop = loop
+        self._wake = asyncio.Event()
+
+    # --- lado del loop ---
+    def subscribe(self):
+        sub = Subscriber(self.buffer)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subs.discard(sub)
+
+    def close(self):
+        # fin de todas las conexiones (apagado): None = fin del stream
+        for sub in list(self._subs):
+            self._evict(sub, count=False)
+
+    def _evict(self, sub, count=True):
+        self._subs.discard(sub)
+        sub.evicted = count
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+        if count:
+            self.evictions += 1
+
+    def _fanout(self, events):
+        for sub in list(self._subs):
+            for ev in events:
+                try:
+                    sub.queue.put_nowait(ev)
+                except asyncio.QueueFull:
+                    self._evict(sub)  # consumidor lento
+                    break
+            else:
+                self.delivered += len(events)
+
+    async def feed(self, fetch, probe, interval):
+        """Publica lo nuevo en orden. await fetch(after) -> (último id, [(id, bytes)]); con after=None sólo
+        el último id actual. probe() cambia con cada commit de cualquier proceso: se sondea cada
+        `interval` s (o antes, con notify()) y sólo si cambió se consulta. Un error de la DB no
+        termina la tarea: se registra, se espera (backoff) y se reintenta."""
+        last = probed = None
+        backoff = interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                v = await asyncio.to_thread(probe)  # p. ej. PRAGMA bajo el lock del manager: fuera del loop
+                if v == probed:
+                    continue
+                if not self._subs or last is None:
+                    # sin clientes sólo se sigue el último id: quien se suscriba recibe desde ahí
+                    last, _ = await fetch(None)
+                    probed = v
+                    continue
+                last, events = await fetch(last)
+                probed = v
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"[WARN] SSE feed: {type(e).__name__}: {e}", file=sys.stderr)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = interval
+            if events:
+                self.published += len(events)
+                self._fanout(events)
+                probed = None  # puede haber más que un lote: volver a consultar
+                self._wake.set()
+
+    # --- lado de los productores (cualquier hilo) ---
+    def notify(self, *_):
+        """Listener del writer local: despierta al feed sin esperar el próximo sondeo."""
+        loop = self._loop
+        if loop is None or not self._subs or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._wake.set)
+
+    def stats(self):
+        return {"subscribers": len(self._subs), "buffer": self.buffer, "published": self.published,
+                "delivered": self.delivered, "evictions": self.evictions, "errors": self.errors}
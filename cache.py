@@ -0,0 +1,183 @@
+﻿import hashlib, os, sys, threading, time
+from collections import OrderedDict
+
+
+def deploy_token():
+    """Identifica el deploy en los ETag: STARLINX_DEPLOY_TOKEN (serve.py genera uno para todos
+    sus workers) o, si no está, tamaño+mtime de los módulos de la app ya importados (sólo
+    stat, nada de leer archivos); cambia con cada deploy, no con cada worker."""
+    token = os.getenv("STARLINX_DEPLOY_TOKEN", "").strip()
+    if token:
+        return token
+    root = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha1()
+    for name, mod in sorted(list(sys.modules.items())):
+        path = getattr(mod, "__file__", None)
+        if name == "__main__" or not path or os.path.dirname(os.path.abspath(path)) != root:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:8]
+
+
+class WriteClock:
+    """Versión de los datos: generación (cada escritura), último id y hora de la última escritura.
+
+    De aquí salen la invalidación del caché y los validadores HTTP (ETag / Last-Modified)
+    sin tocar la DB en cada request.
+
+    Con varios workers, attach() conecta el reloj a la DB: refresh() sondea un
+    contador barato (PRAGMA data_version) y, si otro proceso escribió, recarga la
+    versión global (último seq del feed de cambios). El ETag sale de esa versión,
+    de la identidad de la base y del deploy (deploy_token), así todos los workers dan
+    el mismo ETag para los mismos datos y un deploy nuevo no reusa los viejos. Si la
+    base avisa sola (Postgres: LISTEN/NOTIFY, ver storage.py) se usa advance() en vez
+    de sondear. La versión incluye `epoch` (registros_meta, ver migrations.m010), que
+    sube con cada recálculo de contadores o rollups: así también cambian el ETag y la
+    generación en todos los workers aunque registros no se haya tocado.
+
+    Con attach, modified_at (Last-Modified) es la hora del último cambio según la base
+    (migrations.m011), no la del proceso: todos los workers dan la misma fecha. Puede ser
+    None (base sin cambios fechados): entonces no hay Last-Modified.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.last_id = 0
+        self.version = None  # versión global (attach); None = sólo este proceso
+        self.epoch = 0  # época de mantenimiento (global, de la DB)
+        self.modified_at = time.time()
+        self._boot = f"{os.getpid():x}{int(self.modified_at):x}"  # sin attach: distingue reinicios del proceso
+        self._lock = threading.Lock()
+        self._probe = self._load = None
+        self._probed = None
+        self._dirty = True
+
+    def attach(self, probe=None, load=None, tag=""):
+        """probe() -> valor que cambia con cada commit de cualquier proceso;
+        load() -> (versión, último id, época, hora del último cambio).
+
+        tag identifica la base (p. ej. su inodo): si se recrea, los ETag viejos dejan de valer.
+        Va junto al token del deploy. Sin probe/load la versión llega por advance().
+        """
+        self._probe, self._load, self._boot = probe, load, f"{tag}-{deploy_token()}"
+        self._dirty = True
+        self.refresh()
+
+    def advance(self, version, last_id, epoch=None, modified_at=None):
+        """Versión global empujada por la base; nunca retrocede (los avisos pueden llegar desordenados)."""
+        with self._lock:
+            epoch = self.epoch if epoch is None else int(epoch)
+            if self.version is None:
+                self.modified_at = modified_at  # primera versión: la hora es la de la base, no la del arranque
+            else:
+                if version <= self.version and epoch <= self.epoch:
+                    return
+                version = max(version, self.version)
+                if modified_at is not None:
+                    self.modified_at = max(modified_at, self.modified_at or 0)
+            self.version, self.epoch = version, max(epoch, self.epoch)
+            self.generation += 1
+            self.last_id = max(self.last_id, int(last_id))
+
+    def bump(self, rows=None, last_id=None):
+        # listener del BatchWriter (rows, last_id) o llamada directa tras una escritura
+        with self._lock:
+            self.generation += 1
+            if last_id:
+                self.last_id = max(self.last_id, int(last_id))
+            if self.version is None:
+                self.modified_at = time.time()  # sin attach; si no, la hora la trae refresh/advance
+            self._dirty = True
+
+    def refresh(self):
+        """Trae escrituras de otros procesos (no-op sin attach o si nada cambió)."""
+        if self._probe is None:
+            return
+        probed = self._probe()
+        with self._lock:
+            if probed == self._probed and not self._dirty:
+                return
+            self._probed, self._dirty = probed, False
+        version, last_id, epoch, modified_at = self._load()
+        with self._lock:
+            if (version, epoch) != (self.version, self.epoch):
+                self.version, self.epoch, self.modified_at = version, epoch, modified_at
+                self.generation += 1
+            self.last_id = last_id
+
+    def etag(self):
+        if self.version is not None:
+            return f'W/"{self.version}.{self.epoch}.{self._boot}"'
+        return f'W/"{self.last_id}.{self.generation}.{self._boot}"'
+
+
+class ResponseCache:
+    """LRU en memoria para respuestas ya serializadas (bytes), acotado por tamaño total.
+
+    Cada entrada guarda la "generación de escritura" (WriteClock) vigente cuando se
+    empezó a calcular; cualquier INSERT sube la generación y todas las entradas
+    anteriores pasan a estar vencidas (nunca se sirven datos viejos).
+    """
+
+    def __init__(self, max_bytes, clock):
+        self.max_bytes = int(max_bytes)
+        self.clock = clock
+        self._data: OrderedDict = OrderedDict()  # key -> (gen, body, headers)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    @property
+    def generation(self):
+        return self.clock.generation
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] != self.generation:
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1], item[2]
+
+    def put(self, key, body, gen, headers=None):
+        size = len(body) + len(key[0]) + 64
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if gen != self.generation:
+                return  # hubo escrituras mientras se calculaba: no guardar
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (gen, body, headers or {})
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old, _ = next(iter(self._data.items()))
+                self._drop(old)
+                self.evictions += 1
+
+    def _drop(self, key):
+        gen, body, _ = self._data.pop(key)
+        self._bytes -= len(body) + len(key[0]) + 64
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "generation": self.generation, "hits": self.hits, "misses": self.misses,
+                "stale": self.stale, "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None}
@@ -0,0 +1,95 @@
+﻿"""Exportación columnar (Parquet o Arrow IPC) en streaming, por row groups.
+
+pyarrow es opcional: sin él, available() es False y el endpoint responde 501.
+Se importa en el primer uso (cuesta decenas de ms y no hace falta para arrancar).
+"""
+import asyncio, importlib.util
+
+pa = pq = None
+_available = None
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "registros.parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "registros.arrows"),
+}
+
+
+def available():
+    global _available
+    if _available is None:
+        _available = importlib.util.find_spec("pyarrow") is not None
+    return _available
+
+
+def _load():
+    global pa, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+class _Sink:
+    """Destino tipo archivo en memoria que se vacía después de cada row group."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        b = bytes(data)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _schema(cols):
+    return pa.schema([(c, pa.int64() if c == "id" else pa.string()) for c in cols])
+
+
+def _table(cols, schema, rows):
+    data = list(zip(*rows)) if rows else [[] for _ in cols]
+    return pa.Table.from_arrays([pa.array(col, type=f.type) for col, f in zip(data, schema)], schema=schema)
+
+
+async def stream(batches, cols, fmt="parquet", row_group=50_000, compression="zstd"):
+    """Bytes del archivo a medida que se completa cada row group (memoria ~ un row group).
+
+    batches es un iterable asíncrono; armar y codificar cada row group va en un hilo.
+    """
+    await asyncio.to_thread(_load)
+    schema = _schema(cols)
+    sink = _Sink()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_table
+    else:
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+        write = lambda t: writer.write_table(t, row_group_size=row_group)
+    flush = lambda rows: write(_table(cols, schema, rows))
+    pending = []
+    async for rows in batches:
+        pending.extend(rows)
+        if len(pending) >= row_group:
+            await asyncio.to_thread(flush, pending)
+            pending = []
+            yield sink.drain()
+    if pending:
+        await asyncio.to_thread(flush, pending)
+    await asyncio.to_thread(writer.close)
+    yield sink.drain()
@@ -0,0 +1,63 @@
+﻿"""Lecturas O(1) de la tabla registros_counts (mantenida por triggers, ver migrations.m003)."""
+from migrations import COUNT_DIMS, _dim_key, bump_epoch, dialect_of, rebuild_counts
+
+
+def _rows(con, sql, params=()):
+    if dialect_of(con) == "sqlite":
+        return con.execute(sql, params).fetchall()
+    cur = con.cursor()
+    cur.execute(sql.replace("?", "%s"), params)
+    return cur.fetchall()
+
+
+TOTAL_SQL = "SELECT n FROM registros_counts WHERE dim = 'total' AND key = ''"
+BREAKDOWN_SQL = "SELECT key, n FROM registros_counts WHERE dim = ? AND n > 0 ORDER BY n DESC, key LIMIT ?"
+
+
+def _check_dim(dim):
+    if dim not in COUNT_DIMS:
+        raise ValueError(f"dimensión desconocida: {dim}")
+
+
+def total(con):
+    rows = _rows(con, TOTAL_SQL)
+    return int(rows[0][0]) if rows else 0
+
+
+def breakdown(con, dim, limit=100):
+    """{clave: n} de una dimensión (dia, ciudad, vehiculo), mayores primero."""
+    _check_dim(dim)
+    return {k: int(n) for k, n in _rows(con, BREAKDOWN_SQL, (dim, limit))}
+
+
+# --- mismas lecturas sobre un storage (handlers async, ver storage.py) ---
+async def fetch_total(store):
+    rows = await store.fetchall(TOTAL_SQL)
+    return int(rows[0][0]) if rows else 0
+
+
+async def fetch_breakdown(store, dim, limit=100):
+    _check_dim(dim)
+    return {k: int(n) for k, n in await store.fetchall(BREAKDOWN_SQL, (dim, limit))}
+
+
+def verify(con):
+    """Compara los contadores con un recálculo sobre registros; devuelve las diferencias."""
+    dialect = dialect_of(con)
+    stored = {(d, k): int(n) for d, k, n in _rows(con, "SELECT dim, key, n FROM registros_counts WHERE n != 0")}
+    actual = {}
+    for dim in COUNT_DIMS:
+        key = _dim_key(dim, "r", dialect)
+        group = "" if dim == "total" else f" GROUP BY {key}"
+        for k, n in _rows(con, f"SELECT {key}, COUNT(*) FROM registros r{group}"):
+            if n:
+                actual[(dim, k)] = int(n)
+    diffs = [{"dim": d, "key": k, "stored": stored.get((d, k), 0), "actual": actual.get((d, k), 0)}
+             for d, k in sorted(set(stored) | set(actual)) if stored.get((d, k), 0) != actual.get((d, k), 0)]
+    return {"ok": not diffs, "diffs": diffs[:100], "total": actual.get(("total", ""), 0)}
+
+
+def rebuild(con):
+    rebuild_counts(con)
+    bump_epoch(con)  # ETag y cachés de todos los workers
+    return total(con)
@@ -0,0 +1,196 @@
+﻿import csv, io, os, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:  # POSIX
+    import fcntl
+
+    def _lock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:  # Windows (desarrollo local)
+    import msvcrt
+
+    def _lock_fd(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.01)
+
+    def _unlock_fd(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+DURABILITY_MODES = ("none", "interval", "always")
+
+
+class CsvAppender:
+    """Append a un CSV con un único handle por proceso y lock entre procesos (`<csv>.lock`).
+
+    Cada lote se codifica en un buffer reutilizable y se escribe con un solo write()
+    sobre un fd O_APPEND, así las líneas de distintos workers nunca se mezclan.
+    Durabilidad: none (el SO decide), interval (fsync cada fsync_ms), always (fsync por write).
+    """
+
+    def __init__(self, path, durability="none", fsync_ms=1000):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability debe ser uno de {DURABILITY_MODES}: {durability!r}")
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.durability = durability
+        self.fsync_interval = float(fsync_ms) / 1000.0
+        self._fd: int | None = None
+        self._ino = None
+        self._lock_fd: int | None = None
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self._flusher: threading.Thread | None = None
+        self._closed = threading.Event()
+        self.writes = 0
+        self.fsyncs = 0
+        self.on_fsync = None  # on_fsync() tras cada fsync (CsvExporter adelanta ahí su cursor)
+
+    # --- handles ---
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        self._ino = os.fstat(self._fd).st_ino
+
+    def _ensure_open(self):
+        # si otro proceso reconstruyó el archivo (nuevo inode) o lo borraron, reabrir
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == self._ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+            self._fd = None
+        self._open()
+
+    @contextmanager
+    def locked(self):
+        """Sección crítica entre hilos y procesos (reentrante dentro del mismo hilo)."""
+        with self._rlock:
+            if self._depth == 0:
+                if self._lock_fd is None:
+                    self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                _lock_fd(self._lock_fd)
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    self._ensure_open()
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    _unlock_fd(self._lock_fd)
+
+    # --- escritura ---
+    def _encode(self, rows):
+        buf = self._buf
+        buf.seek(0)
+        buf.truncate()
+        self._writer.writerows(rows)
+        return buf.getvalue().encode("utf-8")
+
+    def append_rows(self, rows):
+        """Agrega filas con un solo write(); devuelve bytes escritos."""
+        with self.locked():
+            data = self._encode(rows)
+            if not data:
+                return 0
+            n = os.write(self._fd, data)
+            self.writes += 1
+            self._after_write()
+            return n
+
+    def append(self, row):
+        return self.append_rows((row,))
+
+    def rewrite(self, header):
+        """Reemplaza el archivo por uno nuevo con sólo el encabezado (reconstrucción).
+
+        Se escribe aparte y se hace os.replace: quien tenga abierto el archivo viejo
+        (descargas en curso, otros workers) sigue viendo su inode intacto.
+        """
+        with self.locked():
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                os.write(fd, self._encode((header,)))
+                if self.durability != "none":
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, self.path)
+            os.close(self._fd)
+            self._open()
+            self._dirty = False
+
+    def size(self):
+        with self.locked():
+            return os.fstat(self._fd).st_size
+
+    def truncate(self, size):
+        """Corta una cola escrita de más (recuperación tras una caída); no se usa en marcha normal."""
+        with self.locked():
+            os.ftruncate(self._fd, size)
+
+    def _after_write(self):
+        if self.durability == "always":
+            self._fsync()
+        elif self.durability == "interval":
+            self._dirty = True
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            self._start_flusher()
+
+    def _fsync(self):
+        os.fsync(self._fd)
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self.fsyncs += 1
+        if self.on_fsync:
+            self.on_fsync()
+
+    def sync(self):
+        with self._rlock:
+            if self._fd is not None and self._dirty:
+                self._fsync()
+
+    def _start_flusher(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+        self._closed.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="csv-fsync", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        # modo interval: garantiza el fsync aunque no lleguen más escrituras
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    def close(self):
+        self._closed.set()
+        with self._rlock:
+            self.sync()
+            for attr in ("_fd", "_lock_fd"):
+                fd = getattr(self, attr)
+                if fd is not None:
+                    os.close(fd)
+                    setattr(self, attr, None)
+
+    def stats(self):
+        return {"durability": self.durability, "fsync_ms": self.fsync_interval * 1000,
+                "writes": self.writes, "fsyncs": self.fsyncs}
@@ -0,0 +1,182 @@
+﻿import os, threading, time
+
+
+class CsvExporter:
+    """Materializa registro.csv desde la tabla registros (la DB es la única fuente).
+
+    Guarda un cursor (último id exportado) en `<csv>.hwm` y en cada pasada sólo
+    agrega las filas con id mayor, en lotes. Si falta el cursor, reconstruye el CSV.
+    Cursor y append van bajo el lock entre procesos del CsvAppender: con varios
+    workers exportando a la vez ninguna fila se duplica.
+
+    El cursor guarda "id tamaño" (tamaño del CSV hasta esa fila) y `.hwm` sólo avanza
+    cuando esos bytes ya están en disco según la durabilidad del appender: always y
+    none lo escriben tras cada lote (none sin garantía ante un corte); interval deja el
+    cursor de la pasada en `<csv>.hwm.pending` (lo ven los demás workers, sin fsync) y
+    lo pasa a `.hwm` después del fsync periódico. Un pending que describe más bytes de
+    los que tiene el archivo se perdió en un corte y se vuelve al `.hwm`.
+    """
+
+    def __init__(self, appender, read, columns, interval_ms=500, batch=1000, on_append=None, on_error=None):
+        self.appender = appender
+        self.path = appender.path
+        self.hwm_path = self.path.with_name(self.path.name + ".hwm")
+        self.pending_path = self.path.with_name(self.path.name + ".hwm.pending")
+        self.read = read              # callable -> context manager con conexión de lectura
+        self.columns = list(columns)
+        self.interval = float(interval_ms) / 1000.0
+        self.batch = int(batch)
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.on_append = on_append    # on_append(segundos) por cada lote escrito (métricas)
+        self.on_error = on_error      # on_error(exc) cuando una pasada falla y se absorbe
+        self.exported = 0
+        self.errors = 0
+        self.hwm = None               # último id exportado (en memoria, tras cada pasada)
+        self._pending = None          # interval: (id, tamaño) escrito por este proceso y aún sin fsync
+        appender.on_fsync = self._on_fsync
+
+    # --- ciclo de vida ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="csv-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        t = self._thread
+        if not t:
+            return
+        self._stop.set()
+        self._wake.set()
+        t.join(timeout)
+        self._thread = None
+        self.sync()
+        self.appender.close()
+
+    def notify(self, *_):
+        # listener del BatchWriter: hay filas nuevas confirmadas
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                self.errors += 1
+                if self.on_error:
+                    self.on_error(e)
+                import sys
+                print(f"[WARN] CSV export failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+    # --- cursor ---
+    @staticmethod
+    def _read_cursor(path):
+        try:
+            parts = path.read_text(encoding="utf-8").split()
+            return int(parts[0]), (int(parts[1]) if len(parts) > 1 else None)
+        except (FileNotFoundError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _write_cursor(path, last_id, size):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(f"{last_id} {size}", encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _read_hwm(self):
+        cur = self._read_cursor(self.hwm_path)
+        return cur[0] if cur else None
+
+    def _current(self):
+        """(id, tamaño) desde donde seguir; None si hay que reconstruir. Bajo el lock."""
+        durable = self._read_cursor(self.hwm_path)
+        pending = self._read_cursor(self.pending_path)
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return None
+        cur = durable
+        if pending and pending[1] is not None and pending[1] <= size and (durable is None or pending[0] >= durable[0]):
+            cur = pending
+        if cur is None or cur[1] is None:
+            return cur
+        if cur[1] > size:
+            return None  # el archivo perdió bytes que el cursor daba por escritos
+        if cur[1] < size:
+            self.appender.truncate(cur[1])  # cola escrita sin cursor (caída entre append y cursor)
+        return cur
+
+    def _advance(self, last_id):
+        size = self.appender.size()
+        if self.appender.durability == "interval":
+            self._pending = (last_id, size)
+            self._write_cursor(self.pending_path, last_id, size)
+        else:
+            # always: append_rows ya hizo fsync; none: el SO decide cuándo llega a disco
+            self._write_cursor(self.hwm_path, last_id, size)
+
+    def _on_fsync(self):
+        # el appender acaba de hacer fsync: lo escrito hasta acá ya está en disco
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        with self.appender.locked():
+            durable = self._read_cursor(self.hwm_path)
+            if durable is None or durable[0] < pending[0]:
+                self._write_cursor(self.hwm_path, *pending)
+
+    # --- exportación ---
+    def sync(self):
+        """Una pasada incremental; devuelve cuántas filas se agregaron."""
+        with self._lock, self.appender.locked():
+            cur = self._current()
+            if cur and cur[0]:
+                with self.read() as con:
+                    max_id = con.execute("SELECT MAX(id) FROM registros").fetchone()[0] or 0
+                if cur[0] > max_id:
+                    cur = None  # la DB se recreó (ids reiniciados): el CSV ya no corresponde
+            if cur is None or self.path.stat().st_size == 0:
+                # sin cursor no sabemos qué hay en el archivo: se reconstruye desde la DB
+                self.appender.rewrite(self.columns)
+                self._pending = None
+                self.pending_path.unlink(missing_ok=True)
+                self._write_cursor(self.hwm_path, 0, self.appender.size())
+                cur = (0, None)
+            hwm = cur[0]
+            total = 0
+            sql = (f"SELECT id, {', '.join(self.columns)} FROM registros "
+                   f"WHERE id > ? ORDER BY id LIMIT {self.batch}")
+            while True:
+                with self.read() as con:
+                    rows = con.execute(sql, (hwm,)).fetchall()
+                if not rows:
+                    break
+                t0 = time.perf_counter()
+                self.appender.append_rows(r[1:] for r in rows)
+                if self.on_append:
+                    self.on_append(time.perf_counter() - t0)
+                hwm = rows[-1][0]
+                self._advance(hwm)
+                total += len(rows)
+                if len(rows) < self.batch:
+                    break
+            self.exported += total
+            self.hwm = hwm
+            return total
+
+    def snapshot(self):
+        """Pone el CSV al día y devuelve su os.stat (tomado sin escrituras en curso)."""
+        with self._lock, self.appender.locked():
+            self.sync()
+            return os.stat(self.path)
+
+    def stats(self):
+        return {"path": str(self.path), "hwm": self.hwm, "hwm_durable": self._read_hwm(), "exported": self.exported,
+                "errors": self.errors, "interval_ms": self.interval * 1000, "batch": self.batch,
+                **self.appender.stats()}
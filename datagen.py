@@ -0,0 +1,241 @@
+﻿"""Datos sintéticos de conductores (Colombia) para pruebas de escala, deterministas por semilla.
+
+Genera filas en el orden de migrations.COLUMNS, ordenadas por timestamp, con
+una curva diaria (picos de mañana y tarde, madrugada casi vacía), menos
+registros los fines de semana y un crecimiento leve en el período. Misma
+semilla + mismos parámetros = mismas filas.
+
+Carga directa:
+    python datagen.py sqlite [ruta.db] -n 1000000 --seed 42
+    python datagen.py postgres postgresql://... -n 1000000      # COPY (psycopg 3)
+    python datagen.py csv data/registro.csv -n 1000000 [--all-columns]
+
+Nota: main.py deriva registro.csv de la DB; para la app corriendo hay que cargar
+la DB (el CSV se reconstruye solo). El destino csv sirve para archivos sueltos.
+"""
+import argparse, csv, random, sys, time, unicodedata
+from datetime import datetime, timedelta
+from bisect import bisect
+from itertools import accumulate
+
+from migrations import COLUMNS
+
+NOMBRES = ["Juan", "José", "Luis", "Carlos", "Andrés", "Jorge", "Diego", "Camilo", "Santiago", "Sebastián",
+           "Alejandro", "Daniel", "David", "Felipe", "Julián", "Óscar", "Miguel", "Fernando", "Jhon", "Wilson",
+           "María", "Ana", "Luz", "Carolina", "Paola", "Diana", "Sandra", "Claudia", "Laura", "Valentina",
+           "Natalia", "Marcela", "Daniela", "Angélica", "Catalina", "Juliana", "Alejandra", "Gloria", "Yuli", "Érika"]
+SEGUNDOS = ["", "", "", "Carlos", "Andrés", "Felipe", "David", "José", "Alberto", "Fernanda", "Alejandra",
+            "Patricia", "Lucía", "Marcela", "Camila", "Eduardo"]
+APELLIDOS = ["Rodríguez", "Gómez", "González", "Martínez", "García", "López", "Hernández", "Sánchez", "Ramírez",
+             "Pérez", "Díaz", "Muñoz", "Rojas", "Moreno", "Jiménez", "Vargas", "Castro", "Gutiérrez", "Ortiz",
+             "Álvarez", "Suárez", "Torres", "Romero", "Ruiz", "Valencia", "Quintero", "Herrera", "Castillo",
+             "Mejía", "Restrepo", "Cárdenas", "Ospina", "Salazar", "Zapata", "Cardona", "Giraldo", "Osorio"]
+# ciudad -> peso aproximado por población
+CIUDADES = {"Bogotá": 30, "Medellín": 15, "Cali": 12, "Barranquilla": 8, "Cartagena": 5, "Bucaramanga": 5,
+            "Cúcuta": 4, "Pereira": 3, "Ibagué": 3, "Santa Marta": 3, "Manizales": 3, "Villavicencio": 3,
+            "Pasto": 2, "Montería": 2, "Neiva": 2}
+# mismas opciones que el formulario de los backups
+VEHICULOS = {"Sedan": 45, "SUV": 25, "Van": 12, "Premium": 10, "Otro": 8}
+DOMINIOS = {"gmail.com": 55, "hotmail.com": 22, "outlook.com": 10, "yahoo.com": 8, "une.net.co": 5}
+# prefijos de celular (3xx)
+PREFIJOS = ["300", "301", "302", "304", "305", "310", "311", "312", "313", "314", "315", "316", "317", "318",
+            "319", "320", "321", "322", "323", "324", "350", "351"]
+# peso relativo de cada hora del día: madrugada baja, picos 7-9 y 17-19
+CURVA_HORARIA = [1, 0.6, 0.4, 0.3, 0.5, 1.5, 4, 8, 9, 7, 6, 6, 6.5, 6, 5.5, 6, 7, 9, 8.5, 6, 4.5, 3.5, 2.5, 1.5]
+CURVA_SEMANAL = [1.0, 1.05, 1.05, 1.0, 1.1, 0.7, 0.45]  # lunes..domingo
+
+
+def _sin_tildes(s):
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+
+def _dias(n, start, days, growth):
+    """Filas por día: curva semanal + crecimiento lineal; suma exactamente n."""
+    pesos = [CURVA_SEMANAL[(start + timedelta(days=d)).weekday()] * (1 + growth * d / max(days - 1, 1))
+             for d in range(days)]
+    total = sum(pesos)
+    cuotas = [n * p / total for p in pesos]
+    out = [int(c) for c in cuotas]
+    # repartir el resto por mayor fracción (determinista)
+    for d in sorted(range(days), key=lambda d: out[d] - cuotas[d])[:n - sum(out)]:
+        out[d] += 1
+    return out
+
+
+def generate(n, seed=0, start="2025-01-01", days=365, growth=0.5):
+    """Genera n filas (tuplas en el orden de COLUMNS), en orden de timestamp."""
+    rng = random.Random(seed)
+    rand = rng.random  # un float por decisión: mucho más barato que choice()/randrange()
+    start = datetime.fromisoformat(start)
+
+    def pesado(tabla):
+        # elección ponderada por bisección sobre los pesos acumulados
+        valores, acum = list(tabla), list(accumulate(tabla.values()))
+        total = acum[-1]
+        return lambda: valores[bisect(acum, rand() * total)]
+
+    def uno(seq):
+        return lambda: seq[int(rand() * len(seq))]
+
+    ciudad, vehiculo, dominio = pesado(CIUDADES), pesado(VEHICULOS), pesado(DOMINIOS)
+    nombre1, segundo, apellido, prefijo = uno(NOMBRES), uno(SEGUNDOS), uno(APELLIDOS), uno(PREFIJOS)
+    ascii_ = {p: _sin_tildes(p).lower() for p in NOMBRES + APELLIDOS}
+    w_hora = list(accumulate(CURVA_HORARIA))
+    # documentos únicos: permutación afín de [0, M) (A coprimo con M)
+    M, A, B = 900_000_000, 282_475_249, rng.randrange(900_000_000)
+    i = 0
+    for d, k in enumerate(_dias(n, start, days, growth)):
+        dia = start + timedelta(days=d)
+        segundos = sorted(h * 3600 + int(rand() * 3600)
+                          for h in rng.choices(range(24), cum_weights=w_hora, k=k))
+        for s in segundos:
+            n1, n2, ap1, ap2 = nombre1(), segundo(), apellido(), apellido()
+            yield ((dia + timedelta(seconds=s)).isoformat(timespec="seconds"),
+                   f"{n1} {n2} {ap1} {ap2}" if n2 else f"{n1} {ap1} {ap2}",
+                   str(1_000_000_000 + (i * A + B) % M),
+                   f"{prefijo()}{int(rand() * 10_000_000):07d}",
+                   f"{ascii_[n1]}.{ascii_[ap1]}{1 + int(rand() * 999)}@{dominio()}",
+                   ciudad(),
+                   vehiculo(),
+                   f"181.{48 + int(rand() * 16)}.{int(rand() * 256)}.{1 + int(rand() * 254)}")
+            i += 1
+
+
+def _chunks(rows, size):
+    chunk = []
+    for r in rows:
+        chunk.append(r)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- destinos ---
+def load_sqlite(path, rows, batch=50_000, expected=None):
+    """Carga masiva en una sola transacción (atómica: otro proceso ve todo o nada).
+
+    Los triggers de registros (FTS, contadores, rollups, feed de cambios) se quitan
+    durante la carga y se recrean al final con su misma definición; lo derivado se
+    recalcula en bloque. Si `expected` (filas a cargar) es chico frente a lo que ya
+    hay, recalcular todo sale más caro: se inserta con los triggers puestos.
+    """
+    import migrations, search, sqlite3
+    from db_pool import configure
+    con = configure(sqlite3.connect(str(path), isolation_level=None))
+    migrations.migrate(con)
+    sql = f"INSERT INTO registros ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        first, existing = con.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM registros").fetchone()
+        bulk = expected is None or expected * 10 >= existing
+        triggers = con.execute("SELECT name, sql FROM sqlite_master "
+                               "WHERE type = 'trigger' AND tbl_name = 'registros'").fetchall() if bulk else []
+        for name, _ in triggers:
+            con.execute(f"DROP TRIGGER {name}")
+        n = 0
+        for chunk in _chunks(rows, batch):
+            con.executemany(sql, chunk)
+            n += len(chunk)
+        if bulk:
+            for _, ddl in triggers:
+                con.execute(ddl)
+            search.rebuild(con)
+            migrations.rebuild_counts(con)
+            migrations.backfill_rollups(con)
+            con.execute("INSERT INTO registros_changes (op, registro_id, changed_at) "
+                        f"SELECT 'insert', id, {migrations.NOW_SQL['sqlite']} FROM registros WHERE id > ? ORDER BY id",
+                        (first,))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+    return n
+
+
+def load_postgres(url, rows, expected=None):
+    """COPY FROM STDIN con psycopg 3 (import perezoso: sólo hace falta para este destino).
+
+    Como en load_sqlite, los triggers de registros (contadores, rollups, feed de cambios,
+    lock de orden) se desactivan durante el COPY con DISABLE TRIGGER USER, dentro de la
+    misma transacción; lo derivado se recalcula en bloque antes de reactivarlos. El índice
+    GIN de búsqueda lo mantiene Postgres solo. Con `expected` chico frente a lo que ya hay
+    se copia con los triggers puestos.
+    """
+    import psycopg
+    import migrations
+    with psycopg.connect(url, autocommit=True) as con:
+        migrations.migrate(con)
+        n = 0
+        with con.transaction(), con.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM registros")
+            first, existing = cur.fetchone()
+            bulk = expected is None or expected * 10 >= existing
+            if bulk:
+                # ACCESS EXCLUSIVE hasta el COMMIT; después, el lock de m009 que ya no toma el trigger
+                cur.execute("ALTER TABLE registros DISABLE TRIGGER USER")
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (migrations.FEED_LOCK_KEY,))
+            with cur.copy(f"COPY registros ({', '.join(COLUMNS)}) FROM STDIN") as copy:
+                for r in rows:
+                    copy.write_row(r)
+                    n += 1
+            cur.execute("SELECT setval(pg_get_serial_sequence('registros', 'id'), "
+                        "COALESCE((SELECT MAX(id) FROM registros), 0) + 1, false)")
+            if bulk:
+                migrations.rebuild_counts(con)
+                migrations.backfill_rollups(con)
+                # el trigger de NOTIFY está en registros_changes: avisa una vez, al confirmar
+                cur.execute("INSERT INTO registros_changes (op, registro_id) "
+                            "SELECT 'insert', id FROM registros WHERE id > %s ORDER BY id", (first,))
+                cur.execute("ALTER TABLE registros ENABLE TRIGGER USER")
+    return n
+
+
+def load_csv(path, rows, columns=("timestamp", "nombre", "documento", "telefono")):
+    """CSV con el encabezado de registro.csv (o todas las columnas)."""
+    idx = [COLUMNS.index(c) for c in columns]
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(columns)
+        for chunk in _chunks(rows, 50_000):
+            w.writerows([r[i] for i in idx] for r in chunk)
+            n += len(chunk)
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera conductores sintéticos y los carga en SQLite, Postgres o CSV.")
+    ap.add_argument("target", choices=["sqlite", "postgres", "csv"])
+    ap.add_argument("dest", nargs="?", help="ruta .db / URL de Postgres / ruta .csv")
+    ap.add_argument("-n", "--rows", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--start", default="2025-01-01")
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--all-columns", action="store_true", help="csv: todas las columnas, no sólo las de registro.csv")
+    args = ap.parse_args(argv)
+
+    rows = generate(args.rows, args.seed, args.start, args.days)
+    t0 = time.perf_counter()
+    if args.target == "sqlite":
+        import db_fix
+        dest = args.dest or db_fix.app_sqlite_path()
+        n = load_sqlite(dest, rows, expected=args.rows)
+    elif args.target == "postgres":
+        import os
+        dest = args.dest or os.getenv("DATABASE_URL")
+        if not dest:
+            raise SystemExit("falta la URL de Postgres (argumento o DATABASE_URL)")
+        n = load_postgres(dest, rows, expected=args.rows)
+    else:
+        dest = args.dest or "data/registro.csv"
+        n = load_csv(dest, rows, COLUMNS if args.all_columns else ("timestamp", "nombre", "documento", "telefono"))
+    dt = time.perf_counter() - t0
+    print(f"{n} filas en {dt:.1f}s ({n / dt:,.0f} filas/s) -> {dest}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-﻿import os, re, sqlite3, pathlib, time
+﻿import os, re, sqlite3, pathlib, threading
+import migrations, counters
+from db_pool import SQLiteManager, configure, SQLITE_BUSY_MS
 
 def _db_from_env():
     url = os.getenv("DATABASE_URL", "").strip()
@@ -13,7 +15,8 @@ def _db_from_env():
             # fallback seguro
             path = "/tmp/starlinx.db"
         return ("sqlite", path)
-    # Si en el futuro usamos Postgres, adaptar aquí (psycopg/SQLAlchemy)
+    if url.startswith(("postgres://", "postgresql://")):
+        return ("postgres", url)  # ver storage.PostgresStore
     return ("unknown", url)
 
 def get_sqlite_path():
@@ -25,34 +28,53 @@ def get_sqlite_path():
     p.parent.mkdir(parents=True, exist_ok=True)
     return str(p)
 
+def base_dir():
+    # carpeta de la app (DB + data/): STARLINX_BASE_DIR, /tmp en Render o junto al código
+    return pathlib.Path(os.getenv("STARLINX_BASE_DIR") or ("/tmp" if os.getenv("RENDER") else pathlib.Path(__file__).parent))
+
+def app_sqlite_path():
+    # la misma DB que abre main.py: DATABASE_URL sqlite:///... o, sin ella, BASE_DIR/starlinx.db
+    if os.getenv("DATABASE_URL", "").strip():
+        return get_sqlite_path()
+    p = base_dir() / "starlinx.db"
+    p.parent.mkdir(parents=True, exist_ok=True)
+    return str(p)
+
+_managers: dict[str, SQLiteManager] = {}
+_managers_lock = threading.Lock()
+
+def get_manager(path=None):
+    # un SQLiteManager por ruta (writer + lectores WAL), compartido en el proceso.
+    # main.py registra aquí su DB_PATH y lo abre/cierra en el lifespan.
+    path = str(path or get_sqlite_path())
+    with _managers_lock:
+        mgr = _managers.get(path)
+        if mgr is None:
+            mgr = _managers[path] = SQLiteManager(path)
+        return mgr
+
 def connect_sqlite():
-    path = get_sqlite_path()
-    # check writable
-    parent = pathlib.Path(path).parent
-    testfile = parent / (".touch_" + str(int(time.time())))
-    try:
-        with open(testfile, "w") as f:
-            f.write("ok")
-    finally:
-        try:
-            testfile.unlink(missing_ok=True)
-        except Exception:
-            pass
-    con = sqlite3.connect(path, timeout=10, isolation_level=None)
-    return con
+    # conexión suelta (scripts / compat), con los mismos pragmas WAL que el manager.
+    # Si la carpeta no es escribible, sqlite3 falla al abrir: ya no hace falta el archivo .touch_
+    con = sqlite3.connect(get_sqlite_path(), timeout=SQLITE_BUSY_MS / 1000, isolation_level=None)
+    return configure(con)
 
 def ensure_table(con):
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS registros (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT NOT NULL,
-            nombre TEXT NOT NULL,
-            documento TEXT NOT NULL,
-            telefono TEXT NOT NULL
-        )
-    """)
-
-def count_rows(con):
+    # esquema canónico vía migraciones versionadas (antes: registros con columna 'ts')
+    return migrations.migrate(con)
+
+def count_rows(con=None):
+    if con is None:
+        with get_manager().read() as rcon:
+            return count_rows(rcon)
+    return _count_rows(con)
+
+def _count_rows(con):
+    try:
+        # O(1) desde registros_counts (migración 3); COUNT(*) sólo si aún no existe
+        return counters.total(con)
+    except sqlite3.OperationalError:
+        pass
     try:
         cur = con.execute("SELECT COUNT(*) FROM registros")
         (n,) = cur.fetchone()
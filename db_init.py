@@ -1,25 +1,31 @@
 ﻿import os
-from sqlalchemy import create_engine, text
+import migrations
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise SystemExit("DATABASE_URL no está definido (Render lo inyecta).")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+def init_db(database_url=None):
+    """Aplica las migraciones en Postgres (DATABASE_URL) y devuelve la versión del esquema."""
+    # SQLAlchemy/psycopg sólo se cargan aquí: la app no los necesita para arrancar
+    from sqlalchemy import create_engine, text
 
-DDL = '''
-CREATE TABLE IF NOT EXISTS conductores (
-  id SERIAL PRIMARY KEY,
-  nombre TEXT NOT NULL,
-  documento TEXT NOT NULL,
-  telefono TEXT,
-  email TEXT,
-  ciudad TEXT,
-  tipo_vehiculo TEXT,
-  ts TIMESTAMP DEFAULT NOW()
-);
-'''
-with engine.begin() as conn:
-    conn.execute(text(DDL))
-    now = conn.execute(text("SELECT now()")).scalar_one()
-    print("DB OK. Tabla 'conductores' lista.", now)
+    database_url = database_url or os.getenv("DATABASE_URL")
+    if not database_url:
+        raise SystemExit("DATABASE_URL no está definido (Render lo inyecta).")
+
+    engine = create_engine(database_url, pool_pre_ping=True)
+
+    # Esquema canónico vía migraciones versionadas (reemplaza la tabla 'conductores';
+    # sus filas se copian a 'registros' en la migración 1)
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.autocommit = True
+        version = migrations.migrate(raw.driver_connection)
+    finally:
+        raw.close()
+    with engine.begin() as conn:
+        now = conn.execute(text("SELECT now()")).scalar_one()
+    print(f"DB OK. Esquema 'registros' en versión {version}.", now)
+    return version
+
+
+if __name__ == "__main__":
+    init_db()
@@ -0,0 +1,126 @@
+﻿import os, queue, sqlite3, threading, pathlib
+from contextlib import contextmanager
+
+# Pragmas (ajustables por env). synchronous=FULL mantiene la garantía del group commit:
+# cada lote confirmado es durable; con NORMAL en WAL se gana algo de latencia a cambio.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL")
+SQLITE_BUSY_MS     = int(os.getenv("SQLITE_BUSY_MS", "5000"))
+SQLITE_CACHE_KB    = int(os.getenv("SQLITE_CACHE_KB", "20000"))
+SQLITE_MMAP_MB     = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_READERS     = int(os.getenv("SQLITE_READERS", "4"))
+
+
+def configure(con, readonly=False):
+    con.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+    con.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    con.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    con.execute("PRAGMA temp_store=MEMORY")
+    if readonly:
+        con.execute("PRAGMA query_only=ON")
+    else:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    return con
+
+
+class SQLiteManager:
+    """Un único writer + pool de lectores read-only sobre la misma base en modo WAL."""
+
+    def __init__(self, path, readers=SQLITE_READERS):
+        self.path = str(path)
+        self.size = max(1, int(readers))
+        self._writer: sqlite3.Connection | None = None
+        self._wlock = threading.RLock()
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._plock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._watch: sqlite3.Connection | None = None  # sólo para data_version()
+        self._watch_lock = threading.Lock()
+
+    # --- ciclo de vida (lifespan de la app) ---
+    def open(self):
+        with self._open_lock:
+            if self._writer is not None:
+                return self
+            pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                  timeout=SQLITE_BUSY_MS / 1000)
+            self._writer = configure(con)
+            return self
+
+    def close(self):
+        with self._open_lock:
+            with self._plock:
+                while True:
+                    try:
+                        self._pool.get_nowait().close()
+                    except queue.Empty:
+                        break
+                self._created = 0
+            with self._watch_lock:
+                if self._watch is not None:
+                    self._watch.close()
+                    self._watch = None
+            with self._wlock:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    # --- writer ---
+    @contextmanager
+    def write(self):
+        """Conexión de escritura (autocommit; usar BEGIN/COMMIT explícitos). Serializada por lock."""
+        if self._writer is None:
+            self.open()
+        with self._wlock:
+            yield self._writer
+
+    # --- lectores ---
+    def _new_reader(self):
+        uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+        con = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                              timeout=SQLITE_BUSY_MS / 1000)
+        return configure(con, readonly=True)
+
+    @contextmanager
+    def read(self):
+        """Conexión read-only del pool; en WAL nunca espera al writer."""
+        if self._writer is None:
+            self.open()
+        con = None
+        try:
+            con = self._pool.get_nowait()
+        except queue.Empty:
+            with self._plock:
+                if self._created < self.size:
+                    self._created += 1
+                    try:
+                        con = self._new_reader()
+                    except Exception:
+                        self._created -= 1
+                        raise
+        if con is None:
+            con = self._pool.get(timeout=SQLITE_BUSY_MS / 1000)
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+            self._pool.put(con)
+
+    def data_version(self):
+        """PRAGMA data_version de una conexión fija: cambia cuando otra conexión (de este u otro
+        proceso) confirma una escritura. Barato (no lee páginas): sirve para sondear en cada request."""
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = self._new_reader()
+            return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self):
+        return {"path": self.path, "open": self.is_open, "readers": self._created,
+                "readers_idle": self._pool.qsize(), "readers_max": self.size}
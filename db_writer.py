@@ -0,0 +1,178 @@
+﻿import queue, threading, time
+from concurrent.futures import Future, InvalidStateError
+
+
+class BatchWriter:
+    """Escritor en segundo plano: agrupa INSERTs en una sola transacción (group commit)."""
+
+    def __init__(self, acquire, sql, flush_ms=5.0, max_batch=256):
+        self.acquire = acquire        # callable -> context manager que entrega la conexión writer
+        self.sql = sql
+        self.flush_ms = float(flush_ms)
+        self.max_batch = int(max_batch)
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._listeners = []
+        self._reset_stats()
+
+    # --- ciclo de vida ---
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="db-batch-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            t = self._thread
+            if not t:
+                return
+            self._q.put(None)  # centinela: vacía lo pendiente y termina
+            t.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    # --- API ---
+    def submit(self, params) -> Future:
+        if not self.running:
+            self.start()
+        fut: Future = Future()
+        self._q.put((tuple(params), fut, time.perf_counter()))
+        return fut
+
+    def write(self, params, timeout=None):
+        """Encola una fila y espera a que su lote quede confirmado (commit)."""
+        return self.submit(params).result(timeout)
+
+    def add_listener(self, fn):
+        """fn(rows, last_id) se llama tras cada commit; los ids del lote son consecutivos hasta last_id."""
+        self._listeners.append(fn)
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        b = s["batches"] or 1
+        r = s["rows"] or 1
+        return {
+            "flush_ms": self.flush_ms,
+            "max_batch": self.max_batch,
+            "pending": self._q.qsize(),
+            "batches": s["batches"],
+            "rows": s["rows"],
+            "errors": s["errors"],
+            "batch_size_avg": round(s["rows"] / b, 2),
+            "batch_size_max": s["batch_max"],
+            "commit_ms_avg": round(s["commit_s"] / b * 1000, 3),
+            "commit_ms_max": round(s["commit_s_max"] * 1000, 3),
+            "latency_ms_avg": round(s["latency_s"] / r * 1000, 3),
+            "latency_ms_max": round(s["latency_s_max"] * 1000, 3),
+        }
+
+    def _reset_stats(self):
+        self._stats = {"batches": 0, "rows": 0, "errors": 0, "batch_max": 0,
+                       "commit_s": 0.0, "commit_s_max": 0.0,
+                       "latency_s": 0.0, "latency_s_max": 0.0}
+
+    # --- hilo del writer ---
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.flush_ms / 1000.0
+        stop = False
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._q.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            self._guarded_flush(batch)
+        # vaciar lo que quede en cola antes de salir
+        rest = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                rest.append(item)
+        if rest:
+            self._guarded_flush(rest)
+
+    def _guarded_flush(self, batch):
+        # el hilo no puede morir por un lote: si muere, todo submit() posterior queda colgado
+        try:
+            self._flush(batch)
+        except Exception as e:
+            for _, fut, _ in batch:
+                try:
+                    fut.set_exception(e)
+                except InvalidStateError:
+                    pass  # ya resuelto o cancelado
+
+    def _flush(self, batch):
+        # filas cuyo request ya se canceló (cliente desconectado) no se escriben: nadie espera su ack.
+        # Tras set_running_or_notify_cancel() el Future ya no se puede cancelar, así que
+        # set_result / set_exception más abajo nunca fallan
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        try:
+            with self.acquire() as con:
+                try:
+                    # IMMEDIATE: toma el lock de escritura al empezar, así busy_timeout espera
+                    # a los writers de otros procesos en vez de fallar a mitad del lote
+                    con.execute("BEGIN IMMEDIATE")
+                    rows = [params for params, _, _ in batch]
+                    con.executemany(self.sql, rows)
+                    last_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    con.execute("COMMIT")
+                except Exception:
+                    if con.in_transaction:
+                        con.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += len(batch)
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        t1 = time.perf_counter()
+        lat_sum = lat_max = 0.0
+        for _, fut, t_in in batch:
+            fut.set_result(None)
+            lat = t1 - t_in
+            lat_sum += lat
+            lat_max = max(lat_max, lat)
+        with self._stats_lock:
+            s = self._stats
+            s["batches"] += 1
+            s["rows"] += len(batch)
+            s["batch_max"] = max(s["batch_max"], len(batch))
+            s["commit_s"] += t1 - t0
+            s["commit_s_max"] = max(s["commit_s_max"], t1 - t0)
+            s["latency_s"] += lat_sum
+            s["latency_s_max"] = max(s["latency_s_max"], lat_max)
+        for fn in self._listeners:
+            try:
+                fn(rows, last_id)
+            except Exception:
+                pass
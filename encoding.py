@@ -0,0 +1,153 @@
+﻿"""Compresión negociada (gzip y zstd si está disponible) aplicada en streaming.
+
+Las variantes completas ya comprimidas se guardan en disco (VariantStore) y se
+reutilizan mientras los datos no cambien: se guardan por clave (filtros) y versión (ETag).
+Los streams son asíncronos; compresión y escritura a disco van en hilos (no frenan el loop).
+
+(No se llama compression.py: taparía el paquete `compression` de la stdlib de 3.14, que
+usan gzip/bz2/lzma y de donde sale el zstd de respaldo.)
+"""
+import asyncio, hashlib, os, uuid, zlib
+from pathlib import Path
+
+try:  # zstd es opcional: módulo `zstandard` (pip) o compression.zstd (Python 3.14+)
+    import zstandard as _zstd
+
+    def _zstd_compressobj(level):
+        return _zstd.ZstdCompressor(level=level).compressobj()
+except ImportError:
+    try:
+        from compression import zstd as _zstd
+
+        def _zstd_compressobj(level):
+            return _zstd.ZstdCompressor(level=level)
+    except ImportError:
+        _zstd = None
+
+SUFFIX = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def available():
+    # orden de preferencia del servidor cuando el cliente acepta varias con igual q
+    return ("zstd", "gzip") if _zstd is not None else ("gzip",)
+
+
+def negotiate(accept_encoding, codecs=None):
+    """Elige codificación según Accept-Encoding (con q-values); None = identidad."""
+    codecs = codecs or available()
+    if not accept_encoding:
+        return None
+    prefs = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for codec in codecs:
+        q = prefs.get(codec, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+
+def level_for(route, codec):
+    """Nivel por ruta: EXPORT_<RUTA>_<CODEC>_LEVEL, luego EXPORT_<CODEC>_LEVEL, luego el default."""
+    env = os.getenv(f"EXPORT_{route.upper()}_{codec.upper()}_LEVEL") or os.getenv(f"EXPORT_{codec.upper()}_LEVEL")
+    return int(env) if env else DEFAULT_LEVELS[codec]
+
+
+def compressobj(codec, level):
+    if codec == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = contenedor gzip
+    if codec == "zstd" and _zstd is not None:
+        return _zstd_compressobj(level)
+    raise ValueError(f"codificación no soportada: {codec}")
+
+
+async def compress_iter(chunks, codec, level, min_chunk=64 * 1024):
+    """Comprime un iterable asíncrono de bytes en streaming; emite bloques de ~min_chunk."""
+    c = compressobj(codec, level)
+    pending = []
+    size = 0
+    async for chunk in chunks:
+        out = await asyncio.to_thread(c.compress, chunk)
+        if out:
+            pending.append(out)
+            size += len(out)
+        if size >= min_chunk:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(c.flush())
+    yield b"".join(pending)
+
+
+def encoded_etag(etag, codec):
+    # cada representación codificada necesita su propio ETag
+    if not codec:
+        return etag
+    weak = etag.startswith("W/")
+    tag = etag[2:] if weak else etag
+    return ("W/" if weak else "") + tag[:-1] + f'-{codec}"'
+
+
+class VariantStore:
+    """Archivos comprimidos completos por (nombre, clave, versión, codificación).
+
+    La clave distingue representaciones del mismo recurso (p. ej. los filtros del query)
+    y la versión es el ETag de los datos: `<nombre>.<hash clave>.<hash versión><sufijo>`.
+    """
+
+    def __init__(self, directory):
+        self.dir = Path(directory)
+
+    @staticmethod
+    def _h(value):
+        return hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+
+    def path(self, name, key, version, codec):
+        return self.dir / f"{name}.{self._h(key)}.{self._h(version)}{SUFFIX[codec]}"
+
+    def get(self, name, key, version, codec):
+        p = self.path(name, key, version, codec)
+        return p if p.exists() else None
+
+    async def tee(self, chunks, name, key, version, codec):
+        """Reenvía los bloques (iterable asíncrono) y, si el stream termina completo, lo deja guardado como variante."""
+        final = self.path(name, key, version, codec)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # tmp único por stream: dos requests (del mismo o de otro worker) pueden armar la misma variante
+        tmp = final.with_name(final.name + f".{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+        ok = False
+        try:
+            f = await asyncio.to_thread(open, tmp, "wb")
+            try:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+                    yield chunk
+            finally:
+                f.close()
+            ok = True
+        finally:
+            if ok:
+                os.replace(tmp, final)
+                self.prune(name, keep=final)
+            else:
+                tmp.unlink(missing_ok=True)
+
+    def prune(self, name, keep=None):
+        """Borra las variantes de `name` de otras versiones; las de otras claves de la misma
+        versión (otros filtros, otras codificaciones) se quedan."""
+        version = keep.name[len(name) + 1:].split(".")[1] if keep is not None else None
+        for p in self.dir.glob(f"{name}.*"):
+            if p == keep or p.name.endswith(".tmp") or p.suffix not in (".gz", ".zst"):
+                continue
+            parts = p.name[len(name) + 1:].split(".")
+            if version is None or len(parts) != 3 or parts[1] != version:
+                p.unlink(missing_ok=True)
@@ -1,61 +1,160 @@
 ﻿from fastapi import FastAPI, Form, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse, Response, FileResponse
 from starlette.middleware.sessions import SessionMiddleware
-import os, csv, sqlite3
-from pathlib import Path
+import os, io, csv, json, time, asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
+import db_fix, storage, search, metrics, counters, rollups, queries, columnar, templates
+from csv_append import CsvAppender
+from csv_export import CsvExporter
+from responses import FileSnapshot, file_etag, snapshot_response, is_not_modified, not_modified, validator_headers
+from cache import ResponseCache, WriteClock
+from encoding import VariantStore, negotiate, compress_iter, encoded_etag, level_for
+from broadcast import Hub, sse
 
-app = FastAPI(title="STARLINX Protoapp")
+@asynccontextmanager
+async def lifespan(app):
+    # todo el I/O de arranque vive aquí: importar main no toca disco ni DB
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    await STORE.open()
+    await STORE.migrate()
+    # versión global de los datos (compartida entre workers; ver WriteClock.attach)
+    HUB.bind(asyncio.get_running_loop())
+    await STORE.bind_clock(CLOCK, on_remote_write)
+    feed = asyncio.create_task(HUB.feed(stream_events, STORE.probe, SSE_POLL_MS / 1000))
+    EXPORTER.start()
+    try:
+        yield
+    finally:
+        HUB.close()
+        feed.cancel()
+        await asyncio.to_thread(EXPORTER.stop)
+        await STORE.close()
+
+app = FastAPI(title="STARLINX Protoapp", lifespan=lifespan)
 
 # --- Config ---
 ADMIN_KEY = os.getenv("ADMIN_KEY", "starlinx123")
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 
+# --- Métricas (Prometheus en /admin/metrics) ---
+METRICS = metrics.Registry()
+REQUEST_SECONDS = METRICS.histogram("starlinx_request_duration_seconds", "Latencia total por ruta",
+                                    ("method", "route", "status"))
+STAGE_SECONDS = METRICS.histogram("starlinx_stage_duration_seconds", "Latencia por etapa del camino de escritura",
+                                  ("stage",))
+ERRORS_TOTAL = METRICS.counter("starlinx_swallowed_errors_total", "Fallos absorbidos sin romper la respuesta",
+                               ("store",))
+for _store in ("csv", "db"):
+    ERRORS_TOTAL.inc(_store, amount=0)  # series visibles desde el arranque
+BATCH_ROWS = METRICS.histogram("starlinx_db_batch_rows", "Filas por lote confirmado (group commit)",
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+app.add_middleware(metrics.MetricsMiddleware, histogram=REQUEST_SECONDS)
+
 # Paths: CSV y DB
-IS_RENDER = bool(os.getenv("RENDER"))
-BASE_DIR = Path("/tmp") if IS_RENDER else Path(__file__).parent
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
+# STARLINX_BASE_DIR: otra carpeta para DB + data/ (benchmarks, pruebas locales)
+BASE_DIR = db_fix.base_dir()
+DATA_DIR = BASE_DIR / "data"  # se crea en el lifespan
 CSV_PATH = DATA_DIR / "registro.csv"
 
-DB_PATH = (BASE_DIR / "starlinx.db")
-DB_URL  = f"sqlite:///{DB_PATH}"  # informativo
-# Crear CSV si no existe
-if not CSV_PATH.exists():
-    with CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(["timestamp","nombre","documento","telefono"])
-
-# --- Helpers DB (sqlite3) ---
-def db_conn():
-    # check_same_thread=False para uvicorn workers
-    return sqlite3.connect(str(DB_PATH), check_same_thread=False)
-
-def ensure_table():
-    with db_conn() as con:
-        con.execute("""
-            CREATE TABLE IF NOT EXISTS registros (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                nombre TEXT NOT NULL,
-                documento TEXT NOT NULL,
-                telefono TEXT NOT NULL
-            )
-        """)
-        con.commit()
-
-def db_exec(sql, params=()):
-    with db_conn() as con:
-        cur = con.execute(sql, params)
-        con.commit()
-        return cur.rowcount
-
-def db_query(sql, params=()):
-    with db_conn() as con:
-        cur = con.execute(sql, params)
-        cols = [c[0] for c in cur.description]
-        out = [dict(zip(cols, row)) for row in cur.fetchall()]
-        return out
+DB_PATH = (BASE_DIR / "starlinx.db")  # sin DATABASE_URL
+# Group commit: los INSERT de /registro se agrupan cada DB_BATCH_MS ms o cada DB_BATCH_MAX filas
+DB_BATCH_MS  = float(os.getenv("DB_BATCH_MS", "5"))
+DB_BATCH_MAX = int(os.getenv("DB_BATCH_MAX", "256"))
+# registro.csv es derivado: lo materializa CsvExporter desde la DB (cada CSV_EXPORT_MS o al confirmar lotes)
+CSV_FIELDS = ["timestamp","nombre","documento","telefono"]
+CSV_EXPORT_MS    = float(os.getenv("CSV_EXPORT_MS", "500"))
+CSV_EXPORT_BATCH = int(os.getenv("CSV_EXPORT_BATCH", "1000"))
+# /registros: paginación por keyset (?after_id= / ?before_id= / ?limit=)
+REGISTROS_PAGE_SIZE = int(os.getenv("REGISTROS_PAGE_SIZE", "50"))
+REGISTROS_PAGE_MAX  = int(os.getenv("REGISTROS_PAGE_MAX", "500"))
+# Caché LRU de respuestas de lectura (/registros, /admin/fix/list, /admin/db-count)
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "16"))
+# Exportaciones en streaming: filas por lote leído de la DB
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+PARQUET_ROW_GROUP = int(os.getenv("PARQUET_ROW_GROUP", "50000"))
+# /export/changes: cambios por página (?limit=)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "1000"))
+CHANGES_PAGE_MAX  = int(os.getenv("CHANGES_PAGE_MAX", "10000"))
+# /admin/stream (SSE): eventos en cola por cliente, keepalive, reenvío máximo tras reconectar
+# y cada cuánto se mira si otro worker escribió (sólo con clientes conectados)
+SSE_BUFFER = int(os.getenv("SSE_BUFFER", "256"))
+SSE_POLL_MS = float(os.getenv("SSE_POLL_MS", "250"))
+SSE_PING_S = float(os.getenv("SSE_PING_S", "15"))
+SSE_REPLAY_MAX = int(os.getenv("SSE_REPLAY_MAX", "1000"))
+# Durabilidad del CSV: none | interval (fsync cada CSV_FSYNC_MS) | always
+CSV_DURABILITY = os.getenv("CSV_DURABILITY", "interval")
+CSV_FSYNC_MS   = float(os.getenv("CSV_FSYNC_MS", "1000"))
+
+# --- Storage (storage.py): SQLite local o Postgres según DATABASE_URL ---
+# SQLite: un writer dedicado + pool de lectores read-only (WAL), INSERTs con group commit.
+# Postgres: pool asíncrono de psycopg 3. Los handlers sólo hacen await sobre STORE.
+STORE = storage.from_env(DB_PATH, DB_BATCH_MS, DB_BATCH_MAX)
+CSV_APPENDER = CsvAppender(CSV_PATH, durability=CSV_DURABILITY, fsync_ms=CSV_FSYNC_MS)
+# registro.csv (SQLite o Postgres): snapshot materializado que /export/csv sirve con Range/If-Range
+EXPORTER = CsvExporter(CSV_APPENDER, STORE.read, CSV_FIELDS, interval_ms=CSV_EXPORT_MS, batch=CSV_EXPORT_BATCH,
+                       on_append=lambda dt: STAGE_SECONDS.observe(dt, "csv_append"),
+                       on_error=lambda e: ERRORS_TOTAL.inc("csv"))
+STORE.add_listener(EXPORTER.notify)
+# Versión de datos (generación + último id): invalida el caché y da los ETag; entre workers se
+# sincroniza con STORE.refresh(CLOCK) (SQLite: un PRAGMA por request; Postgres: LISTEN/NOTIFY)
+CLOCK = WriteClock()
+STORE.add_listener(CLOCK.bump)
+# Caché de respuestas de lectura: cada lote confirmado sube la generación y vence lo anterior
+CACHE = ResponseCache(RESPONSE_CACHE_MB * 1024 * 1024, CLOCK)
+# Variantes comprimidas completas de las exportaciones (se reusan hasta que cambian los datos)
+VARIANTS = VariantStore(DATA_DIR / "cache")
+STORE.add_listener(lambda rows, last_id: BATCH_ROWS.observe(len(rows)))
+# Difusión en vivo (/admin/stream): el feed lee de la DB lo que confirme cualquier worker;
+# el writer local sólo lo despierta antes del próximo sondeo
+HUB = Hub(SSE_BUFFER)
+STORE.add_listener(HUB.notify)
+
+def on_remote_write():
+    # aviso de escrituras de otros workers (Postgres: NOTIFY): SSE y registro.csv sin esperar al sondeo
+    HUB.notify()
+    EXPORTER.notify()
+
+async def refresh_clock():
+    # trae escrituras de otros workers (seq de registros_changes y época de mantenimiento, ver migrations.m007/m010)
+    await STORE.refresh(CLOCK)
+
+STREAM_COLS = "id, " + ", ".join(CSV_FIELDS)
+
+async def stream_events(after):
+    """Para HUB.feed: registros con id > after como eventos SSE (after=None: sólo el último id)."""
+    if after is None:
+        return await STORE.fetchval("SELECT COALESCE(MAX(id), 0) FROM registros"), []
+    # media cola por lote: una ráfaga de otros workers no llena de golpe la cola de un cliente al día
+    rows = await STORE.fetch(f"SELECT {STREAM_COLS} FROM registros WHERE id > ? ORDER BY id LIMIT ?",
+                             (after, max(1, SSE_BUFFER // 2)))
+    return (rows[-1]["id"] if rows else after), [(r["id"], sse(r["id"], r)) for r in rows]
+
+async def cached_response(request: Request, build, media_type="application/json"):
+    """Respuesta desde el LRU si nada se escribió desde que se calculó; si no, await build() y guardar.
+
+    Antes de todo, GET condicional contra el WriteClock: si el cliente ya tiene esta
+    versión, 304 sin tocar caché ni DB.
+    Clave: ruta + query params (sin la clave admin `k`). build() devuelve str/bytes o algo serializable a JSON.
+    """
+    await refresh_clock()
+    etag, modified_at = CLOCK.etag(), CLOCK.modified_at
+    if is_not_modified(request.headers, etag, modified_at):
+        return not_modified(etag, modified_at)
+    headers = validator_headers(etag, modified_at)
+    key = (request.url.path, tuple(sorted((n, v) for n, v in request.query_params.multi_items() if n != "k")))
+    hit = CACHE.get(key)
+    if hit is not None:
+        return Response(hit[0], media_type=media_type, headers={**headers, "X-Cache": "hit"})
+    gen = CACHE.generation
+    body = await build()
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    elif not isinstance(body, bytes):
+        body = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    CACHE.put(key, body, gen)
+    return Response(body, media_type=media_type, headers={**headers, "X-Cache": "miss"})
 
 # --- Admin guard ---
 def _check_admin(request: Request, k: str | None):
@@ -66,23 +165,25 @@ def _check_admin(request: Request, k: str | None):
         return
     raise HTTPException(status_code=401, detail="no autorizado")
 
-# --- UI mínima ---
+# --- UI mínima (plantillas compiladas al importar; ver templates.py) ---
+BASE_CSS = """:root{--bg:#f6f7fb;--card:#fff;--accent:#0b5ed7;--muted:#6b7280}
+body{margin:0;font-family:Inter,Arial,sans-serif;background:var(--bg);color:#111827}
+.container{max-width:720px;margin:24px auto;padding:16px}
+.card{background:var(--card);border-radius:14px;box-shadow:0 6px 20px rgba(0,0,0,.07);padding:18px}
+h1{margin:0 0 10px;font-size:20px}
+.btn{display:inline-block;margin-right:8px;margin-top:8px;padding:8px 12px;background:#eef2ff;border-radius:10px;color:#1e3a8a;text-decoration:none}
+.btn.muted{background:#f1f5f9;color:#475569}"""
+
 HOME_HTML = """
 <!doctype html>
 <html><head>
 <meta charset="utf-8"/><meta name="viewport" content="width=device-width, initial-scale=1"/>
 <title>STARLINX Registro</title>
 <style>
-:root{--bg:#f6f7fb;--card:#fff;--accent:#0b5ed7;--muted:#6b7280}
-body{margin:0;font-family:Inter,Arial,sans-serif;background:var(--bg);color:#111827}
-.container{max-width:720px;margin:24px auto;padding:16px}
-.card{background:var(--card);border-radius:14px;box-shadow:0 6px 20px rgba(0,0,0,.07);padding:18px}
-h1{margin:0 0 10px;font-size:20px}
+{{!css}}
 .form{display:grid;gap:10px;max-width:420px}
 input,button{padding:10px;border-radius:10px;border:1px solid #e5e7eb;font-size:15px}
 button{background:var(--accent);color:#fff;border:none;cursor:pointer}
-.btn{display:inline-block;margin-right:8px;margin-top:8px;padding:8px 12px;background:#eef2ff;border-radius:10px;color:#1e3a8a;text-decoration:none}
-.muted{background:#f1f5f9;color:#475569}
 </style>
 </head>
 <body>
@@ -96,7 +197,7 @@ button{background:var(--accent);color:#fff;border:none;cursor:pointer}
       <button type="submit">Enviar</button>
     </form>
     <div>
-      <a class="btn" href="/registros">Registros (CSV)</a>
+      <a class="btn" href="/registros">Registros</a>
       <a class="btn muted" href="/health">Health</a>
       <a class="btn muted" href="/ping">Ping</a>
     </div>
@@ -105,9 +206,34 @@ button{background:var(--accent);color:#fff;border:none;cursor:pointer}
 </body></html>
 """
 
+REGISTRO_OK_HTML = """<!doctype html><html><head>
+<meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
+<title>Registro recibido</title>
+<style>{{!css}}</style></head>
+<body><div class="container"><div class="card">
+<h1>¡Registro recibido!</h1>
+<p><b>{{nombre}}</b> / {{documento}} / {{telefono}}</p>
+<a class="btn" href="/registro">Nuevo registro</a>
+<a class="btn muted" href="/">Inicio</a>
+</div></div></body></html>"""
+
+REGISTROS_HTML = """<!doctype html><html><head><meta charset="utf-8"><title>Registros</title>
+    <style>table{border-collapse:collapse} td,th{border:1px solid #ddd;padding:6px} .pager a{margin-right:12px}</style></head>
+    <body style="font-family:Arial; margin:20px"><h2>Registros</h2>
+    <table>{{!thead}}{{!rows}}</table><p class="pager">{{!pager}}</p></body></html>"""
+
+# estáticas: bytes + gzip/brotli listos; dinámicas: fragmentos codificados + valores escapados
+HOME_PAGE = templates.StaticPage(templates.Template(HOME_HTML, css=BASE_CSS).render())
+REGISTRO_OK = templates.Template(REGISTRO_OK_HTML, css=BASE_CSS)
+REGISTROS_PAGE = templates.Template(
+    REGISTROS_HTML, thead="<tr>" + "".join(f"<th>{templates.escape(c)}</th>" for c in CSV_FIELDS) + "</tr>")
+REGISTROS_ROW = templates.Template("<tr>" + "".join(f"<td>{{{{{c}}}}}</td>" for c in CSV_FIELDS) + "</tr>")
+REGISTROS_PREV = templates.Template('<a href="/registros?before_id={{id}}&amp;limit={{limit}}">&laquo; Anterior</a>')
+REGISTROS_NEXT = templates.Template('<a href="/registros?after_id={{id}}&amp;limit={{limit}}">Siguiente &raquo;</a>')
+
 @app.get("/", response_class=HTMLResponse)
-def home():
-    return HOME_HTML
+def home(request: Request):
+    return HOME_PAGE.response(request)
 
 # --- Salud ---
 @app.get("/health")
@@ -118,133 +244,389 @@ def health():
 def ping():
     return JSONResponse({"pong": True})
 
-# --- Registro (CSV + DB) ---
+# --- Registro (DB; el CSV se deriva) ---
 @app.get("/registro", response_class=HTMLResponse)
-def registro_form():
-    return HOME_HTML
+def registro_form(request: Request):
+    return HOME_PAGE.response(request)
 
 @app.post("/registro", response_class=HTMLResponse)
-def registro_post(nombre: str = Form(...), documento: str = Form(...), telefono: str = Form(...)):
+async def registro_post(request: Request, nombre: str = Form(...), documento: str = Form(...), telefono: str = Form(...)):
+    # etapa "form": desde que llegó el request (middleware) hasta aquí = lectura + parseo + validación del form
+    t = time.perf_counter()
+    STAGE_SECONDS.observe(t - request.scope["state"].get("t_start", t), "form_parse")
     ts = datetime.now().isoformat(timespec="seconds")
 
-    # CSV
+    # DB: única escritura del request; espera (sin ocupar un hilo) a que el lote quede confirmado
     try:
-        with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow([ts, nombre, documento, telefono])
+        with STAGE_SECONDS.time("db_insert"):
+            await STORE.insert((ts, nombre, documento, telefono))
     except Exception as e:
-        # No romper si CSV falla
-        pass
-
-    # DB
-    try:
-        ensure_table()
-        db_exec(
-            "INSERT INTO registros (timestamp, nombre, documento, telefono) VALUES (?, ?, ?, ?)",
-            (ts, nombre, documento, telefono)
-        )
-    except Exception as e:
-        # No romper la respuesta al usuario; log en stderr
+        # ya no se silencia: si no quedó guardado, el usuario debe saberlo
+        ERRORS_TOTAL.inc("db")
         import sys
         print(f"[WARN] DB insert failed: {type(e).__name__}: {e}", file=sys.stderr)
+        raise HTTPException(status_code=503, detail="no se pudo guardar el registro, intenta de nuevo")
 
-    # Respuesta simple
-    return HTMLResponse(f"""<!doctype html><html><head>
-<meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
-<title>Registro recibido</title>
-<style>:root{{--bg:#f6f7fb;--card:#fff;--accent:#0b5ed7;--muted:#6b7280}}body{{margin:0;font-family:Inter,Arial,sans-serif;background:var(--bg);color:#111827}}
-.container{{max-width:720px;margin:24px auto;padding:16px}}
-.card{{background:var(--card);border-radius:14px;box-shadow:0 6px 20px rgba(0,0,0,.07);padding:18px}}
-h1{{margin:0 0 10px;font-size:20px}}
-.btn{{display:inline-block;margin-right:8px;margin-top:8px;padding:8px 12px;background:#eef2ff;border-radius:10px;color:#1e3a8a;text-decoration:none}}
-.btn.muted{{background:#f1f5f9;color:#475569}}</style></head>
-<body><div class="container"><div class="card">
-<h1>¡Registro recibido!</h1>
-<p><b>{nombre}</b> / {documento} / {telefono}</p>
-<a class="btn" href="/registro">Nuevo registro</a>
-<a class="btn muted" href="/">Inicio</a>
-</div></div></body></html>""")
+    # Respuesta simple (valores del usuario escapados)
+    with STAGE_SECONDS.time("html_render"):
+        return HTMLResponse(REGISTRO_OK.render(nombre=nombre, documento=documento, telefono=telefono))
+
+# --- Vistas sencillas (públicas mínimas) ---
+async def fetch_page(after_id: int | None = None, before_id: int | None = None, limit: int = 50):
+    """Página por keyset sobre registros.id (costo constante: índice de la PK, sin OFFSET).
+
+    Devuelve (rows, has_prev, has_next) con las filas en orden ascendente de id.
+    """
+    cols = "id, " + ", ".join(CSV_FIELDS)
+    if before_id is not None:
+        rows = await STORE.fetch(f"SELECT {cols} FROM registros WHERE id < ? ORDER BY id DESC LIMIT ?",
+                                 (before_id, limit + 1))
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        rows = await STORE.fetch(f"SELECT {cols} FROM registros WHERE id > ? ORDER BY id LIMIT ?",
+                                 (after_id or 0, limit + 1))
+        has_prev, has_next = after_id is not None and after_id > 0, len(rows) > limit
+        rows = rows[:limit]
+    return rows, has_prev, has_next
 
-# --- Vistas sencillas CSV (públicas mínimas) ---
 @app.get("/registros", response_class=HTMLResponse)
-def ver_registros():
-    rows = []
-    if CSV_PATH.exists():
-        with CSV_PATH.open("r", encoding="utf-8") as f:
-            rows = list(csv.reader(f))
-    if not rows:
-        rows = [["timestamp","nombre","documento","telefono"]]
-    thead = "<tr>" + "".join(f"<th>{h}</th>" for h in rows[0]) + "</tr>"
-    trs = "".join("<tr>" + "".join(f"<td>{c}</td>" for c in r) + "</tr>" for r in rows[1:])
-    html = f"""<!doctype html><html><head><meta charset="utf-8"><title>Registros CSV</title>
-    <style>table{{border-collapse:collapse}} td,th{{border:1px solid #ddd;padding:6px}}</style></head>
-    <body style="font-family:Arial; margin:20px"><h2>Registros CSV</h2>
-    <table>{thead}{trs}</table></body></html>"""
-    return HTMLResponse(html)
+async def ver_registros(request: Request, after_id: int | None = None, before_id: int | None = None, limit: int = REGISTROS_PAGE_SIZE):
+    limit = max(1, min(limit, REGISTROS_PAGE_MAX))
+    return await cached_response(request, lambda: _render_registros(after_id, before_id, limit), "text/html")
+
+async def _render_registros(after_id, before_id, limit):
+    rows, has_prev, has_next = await fetch_page(after_id, before_id, limit)
+    trs = b"".join(REGISTROS_ROW.render(**{c: r[c] for c in CSV_FIELDS}) for r in rows)
+    pager = []
+    if rows and has_prev:
+        pager.append(REGISTROS_PREV.render(id=rows[0]["id"], limit=limit))
+    if rows and has_next:
+        pager.append(REGISTROS_NEXT.render(id=rows[-1]["id"], limit=limit))
+    return REGISTROS_PAGE.render(rows=trs, pager=b" ".join(pager))
+
+def _compressed(request: Request, route, name, key, etag, chunks_fn, media_type, modified_at=None):
+    """Respuesta comprimida (gzip/zstd) según Accept-Encoding, o None para servir identidad.
+
+    Reutiliza la variante completa en disco si existe para (`key`, `etag`); si no, comprime
+    en streaming y la guarda al terminar. `key` distingue representaciones del recurso (filtros
+    del query) y `etag` es la versión de los datos. Con Range sólo se sirve una variante ya hecha.
+    """
+    version = etag
+    codec = negotiate(request.headers.get("accept-encoding"))
+    if codec is None:
+        return None
+    cached = VARIANTS.get(name, key, version, codec)
+    if cached is None and request.headers.get("range"):
+        return None
+    etag = encoded_etag(etag, codec)
+    if is_not_modified(request.headers, etag, modified_at):
+        resp = not_modified(etag, modified_at)
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
+    headers = {**validator_headers(etag, modified_at), "Content-Encoding": codec, "Vary": "Accept-Encoding"}
+    if cached is not None:
+        return FileResponse(cached, media_type=media_type, headers=headers)
+    body = compress_iter(chunks_fn(), codec, level_for(route, codec))  # chunks_fn(): iterable asíncrono
+    return StreamingResponse(VARIANTS.tee(body, name, key, version, codec), media_type=media_type, headers=headers)
 
 @app.get("/export/csv")
-def export_csv():
-    if not CSV_PATH.exists():
-        return PlainTextResponse("", media_type="text/csv")
-    with CSV_PATH.open("r", encoding="utf-8") as f:
-        content = f.read()
-    return PlainTextResponse(content, media_type="text/csv")
+async def export_csv(request: Request, since: str | None = None, until: str | None = None, ciudad: str | None = None,
+                     vehiculo: str | None = None, documento: str | None = None):
+    await refresh_clock()
+    where, params = queries.build_filters(since, until, ciudad, vehiculo, documento, STORE.dialect)
+    if where:
+        # export parcial: se arma desde la DB con los índices, no desde el archivo completo
+        etag, modified_at = CLOCK.etag(), CLOCK.modified_at
+        chunks = lambda: _csv(iter_registros(CSV_FIELDS, where=where, params=params, as_dict=False), CSV_FIELDS)
+        compressed = _compressed(request, "csv", "export.csv", request.url.query, etag,
+                                 chunks, "text/csv", modified_at)
+        if compressed is not None:
+            return compressed
+        if is_not_modified(request.headers, etag, modified_at):
+            return not_modified(etag, modified_at)
+        headers = {**validator_headers(etag, modified_at), "Vary": "Accept-Encoding"}
+        return StreamingResponse(chunks(), media_type="text/csv", headers=headers)
+    # foto del archivo (stat; el fd se abre recién si hay que mandar bytes) servida con
+    # Range/If-Range para reanudar, Content-Length y ETag de tamaño+mtime; nunca se envían
+    # bytes posteriores. Variante en disco y 304 salen sólo del stat.
+    if EXPORTER.hwm is not None and EXPORTER.hwm >= CLOCK.last_id and CSV_PATH.exists():
+        st = os.stat(CSV_PATH)
+    else:
+        st = await asyncio.to_thread(EXPORTER.snapshot)
+    etag = file_etag(st)
+
+    async def chunks():
+        snap = await asyncio.to_thread(FileSnapshot, CSV_PATH, st)
+        if snap.etag != etag:  # se reconstruyó entre el stat y el open: no guardar otra cosa bajo este ETag
+            snap.close()
+            raise RuntimeError("registro.csv se reconstruyó durante la respuesta")
+        async for chunk in snap.chunks():
+            yield chunk
+
+    compressed = _compressed(request, "csv", "registro.csv", "", etag, chunks, "text/csv", st.st_mtime)
+    if compressed is not None:
+        return compressed
+    if is_not_modified(request.headers, etag, st.st_mtime):
+        return not_modified(etag, st.st_mtime)
+    snap = await asyncio.to_thread(FileSnapshot, CSV_PATH, st)
+    return snapshot_response(snap, request.headers, "text/csv", {"Vary": "Accept-Encoding"})
+
+async def iter_registros(cols, batch=None, where=(), params=(), as_dict=True):
+    """Filas de registros en lotes por keyset, hasta el MAX(id) del inicio (ver queries.iter_rows)."""
+    async for rows in queries.iter_rows(STORE, cols, where, params, batch or EXPORT_BATCH):
+        yield [dict(zip(cols, r)) for r in rows] if as_dict else rows
+
+async def _csv(batches, header):
+    # mismo formato que registro.csv (csv.writer por defecto, CRLF)
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(header)
+    async for rows in batches:
+        w.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+async def _json_array(batches):
+    yield b"["
+    first = True
+    async for rows in batches:
+        chunk = ",".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) for r in rows)
+        yield (chunk if first else "," + chunk).encode("utf-8")
+        first = False
+    yield b"]"
+
+async def _ndjson(batches):
+    async for rows in batches:
+        yield "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows).encode("utf-8")
 
 @app.get("/export/json")
-def export_json():
-    out = []
-    if CSV_PATH.exists():
-        with CSV_PATH.open("r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            out = list(reader)
-    return JSONResponse(out)
+async def export_json(request: Request, format: str = "json", since: str | None = None, until: str | None = None,
+                      ciudad: str | None = None, vehiculo: str | None = None, documento: str | None = None):
+    # 304 antes de abrir cursor alguno si el cliente ya tiene esta versión
+    await refresh_clock()
+    etag, modified_at = CLOCK.etag(), CLOCK.modified_at
+    ndjson = format == "ndjson"
+    media_type = "application/x-ndjson" if ndjson else "application/json"
+    # streaming desde la DB: memoria plana y primer byte inmediato sin importar el tamaño
+    where, params = queries.build_filters(since, until, ciudad, vehiculo, documento, STORE.dialect)
+    chunks = lambda: (_ndjson if ndjson else _json_array)(iter_registros(CSV_FIELDS, where=where, params=params))
+    compressed = _compressed(request, "json", "export.ndjson" if ndjson else "export.json",
+                             request.url.query, etag, chunks, media_type, modified_at)
+    if compressed is not None:
+        return compressed
+    if is_not_modified(request.headers, etag, modified_at):
+        return not_modified(etag, modified_at)
+    headers = {**validator_headers(etag, modified_at), "Vary": "Accept-Encoding"}
+    return StreamingResponse(chunks(), media_type=media_type, headers=headers)
+
+@app.get("/export/parquet")
+async def export_parquet(request: Request, format: str = "parquet", fields: str | None = None,
+                         since: str | None = None, until: str | None = None,
+                         ciudad: str | None = None, vehiculo: str | None = None, documento: str | None = None):
+    # ?format=parquet|arrow&fields=id,timestamp,ciudad&since=2025-01-01&until=2025-02-01&ciudad=...
+    # proyección y filtros van al SQL (índices de migrations.m005); salida por row groups
+    if not columnar.available():
+        raise HTTPException(status_code=501, detail="exportación columnar no disponible: instala pyarrow")
+    if format not in columnar.FORMATS:
+        raise HTTPException(status_code=400, detail=f"formato inválido: {format} ({'|'.join(columnar.FORMATS)})")
+    try:
+        cols = queries.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await refresh_clock()
+    etag, modified_at = CLOCK.etag(), CLOCK.modified_at
+    if is_not_modified(request.headers, etag, modified_at):
+        return not_modified(etag, modified_at)
+    where, params = queries.build_filters(since, until, ciudad, vehiculo, documento, STORE.dialect)
+    batches = queries.iter_rows(STORE, cols, where, params, EXPORT_BATCH)
+    media_type, filename = columnar.FORMATS[format]
+    headers = {**validator_headers(etag, modified_at), "Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(columnar.stream(batches, cols, format, PARQUET_ROW_GROUP),
+                             media_type=media_type, headers=headers)
+
+@app.get("/export/changes")
+async def export_changes(request: Request, cursor: str | None = None, limit: int = CHANGES_PAGE_SIZE):
+    # sincronización incremental: ?cursor=<next_cursor de la respuesta anterior> (vacío = desde el inicio)
+    limit = max(1, min(limit, CHANGES_PAGE_MAX))
+    try:
+        after = queries.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def build():
+        changes, last, more, max_seq = await queries.changes_page(STORE, queries.EXPORT_COLUMNS[1:], after, limit)
+        if after > max_seq:
+            # el feed se reinició (DB recreada): el cliente debe resincronizar desde cero
+            raise HTTPException(status_code=410, detail="cursor vencido: sincroniza de nuevo sin cursor")
+        return {"changes": changes, "next_cursor": queries.encode_cursor(last), "has_more": more}
+    return await cached_response(request, build)
 
 # --- Admin DB ---
 @app.get("/admin/db-test")
 def admin_db_test(request: Request, k: str | None = None):
     _check_admin(request, k)
-    driver = "sqlite"
-    return {"ok": True, "driver": driver, "url": DB_URL}
+    return {"ok": True, **STORE.describe()}
 
 @app.get("/admin/db-init")
-def admin_db_init(request: Request, k: str | None = None):
+async def admin_db_init(request: Request, k: str | None = None):
     _check_admin(request, k)
     try:
-        ensure_table()
-        return {"ok": True, "msg": "tabla creada (IF NOT EXISTS)"}
+        version = await STORE.migrate()
+        return {"ok": True, "msg": "migraciones aplicadas", "schema_version": version}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
 
 @app.get("/admin/db-count")
-def admin_db_count(request: Request, k: str | None = None):
+async def admin_db_count(request: Request, k: str | None = None):
     _check_admin(request, k)
     try:
-        ensure_table()
-        rows = db_query("SELECT COUNT(*) AS cnt FROM registros")
-        return {"count": rows[0]["cnt"] if rows else 0}
+        # O(1): contador mantenido por triggers (registros_counts)
+        async def build():
+            return {"count": await counters.fetch_total(STORE)}
+        return await cached_response(request, build)
     except Exception as e:
         # si la tabla no existe aún (caso raro), devuelve 0
+        ERRORS_TOTAL.inc("db")
         return {"count": 0}
 
+@app.get("/admin/counts")
+async def admin_counts(request: Request, k: str | None = None, limit: int = 50):
+    _check_admin(request, k)
+    out = {"total": await counters.fetch_total(STORE)}
+    for dim in ("dia", "ciudad", "vehiculo"):
+        out[dim] = await counters.fetch_breakdown(STORE, dim, limit)
+    return out
+
+@app.get("/admin/counts/verify")
+async def admin_counts_verify(request: Request, k: str | None = None, rebuild: bool = False):
+    _check_admin(request, k)
+    try:
+        if not rebuild:
+            return await STORE.maintain(counters.verify)
+        before, total = await STORE.maintain(lambda con: (counters.verify(con), counters.rebuild(con)), write=True)
+        CLOCK.bump()
+        await refresh_clock()  # época nueva (registros_meta): ETag distinto en todos los workers
+        return {"ok": True, "rebuilt": True, "total": total, "diffs_before": before["diffs"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
+@app.get("/admin/stats")
+async def admin_stats(request: Request, k: str | None = None, bucket: str = "day",
+                      since: str | None = None, until: str | None = None, group_by: str = ""):
+    # ?bucket=hour|day&since=2025-01-01&until=2025-02-01&group_by=ciudad,vehiculo
+    _check_admin(request, k)
+    try:
+        rows = await rollups.stats(STORE, bucket, since, until, [g.strip() for g in group_by.split(",")])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"bucket": bucket, "since": since, "until": until, "rows": rows}
+
+@app.get("/admin/stats/backfill")
+async def admin_stats_backfill(request: Request, k: str | None = None):
+    _check_admin(request, k)
+    try:
+        max_id = await STORE.maintain(rollups.backfill, write=True)
+        CLOCK.bump()
+        await refresh_clock()  # época nueva (registros_meta): ETag distinto en todos los workers
+        return {"ok": True, "hasta_id": max_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
+@app.get("/admin/cache")
+def admin_cache(request: Request, k: str | None = None, clear: bool = False):
+    _check_admin(request, k)
+    if clear:
+        CACHE.clear()
+    return CACHE.stats()
+
+@app.get("/admin/db-writer")
+def admin_db_writer(request: Request, k: str | None = None):
+    _check_admin(request, k)
+    return {**STORE.stats(), "csv": EXPORTER.stats(), "stream": HUB.stats()}
+
+@app.get("/admin/stream")
+async def admin_stream(request: Request, k: str | None = None):
+    # SSE: cada registro confirmado llega una vez a todos los clientes, sin consultas por cliente.
+    # Al reconectar (Last-Event-ID) se reenvía lo perdido desde la DB, hasta SSE_REPLAY_MAX filas.
+    _check_admin(request, k)
+    last_seen = request.headers.get("last-event-id", "")
+    last_seen = int(last_seen) if last_seen.isdigit() else None
+    sub = HUB.subscribe()
+
+    async def events():
+        seen = 0
+        try:
+            yield b"retry: 2000\n\n"
+            if last_seen is not None:
+                rows = await STORE.fetch(f"SELECT {STREAM_COLS} FROM registros WHERE id > ? ORDER BY id LIMIT ?",
+                                         (last_seen, SSE_REPLAY_MAX))
+                for r in rows:
+                    yield sse(r["id"], r)
+                seen = rows[-1]["id"] if rows else last_seen
+            while True:
+                try:
+                    item = await asyncio.wait_for(sub.get(), SSE_PING_S)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if item is None:
+                    if sub.evicted:
+                        yield b"event: evicted\ndata: {}\n\n"
+                    return
+                if item[0] > seen:
+                    yield item[1]
+        finally:
+            HUB.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/admin/metrics")
+def admin_metrics(request: Request, k: str | None = None):
+    _check_admin(request, k)
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+# --- Búsqueda (FTS5) ---
+@app.get("/admin/search")
+async def admin_search(request: Request, q: str = "", k: str | None = None, limit: int = 20):
+    _check_admin(request, k)
+    limit = max(1, min(limit, 200))
+    try:
+        rows = await search.search(STORE, q, limit)
+        return {"q": q, "rows": rows}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
+@app.get("/admin/search/rebuild")
+async def admin_search_rebuild(request: Request, k: str | None = None):
+    _check_admin(request, k)
+    try:
+        n = await STORE.maintain(search.rebuild, write=True)
+        return {"ok": True, "indexed": n}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
+
 # --- Fix tools ---
 @app.get("/admin/fix/insert")
-def admin_fix_insert(request: Request, k: str | None = None, nombre: str = "Fix Test", documento: str = "DOC-FIX", telefono: str = "000"):
+async def admin_fix_insert(request: Request, k: str | None = None, nombre: str = "Fix Test", documento: str = "DOC-FIX", telefono: str = "000"):
     _check_admin(request, k)
-    ensure_table()
     try:
-        db_exec(
-            "INSERT INTO registros (timestamp, nombre, documento, telefono) VALUES (?, ?, ?, ?)",
-            (datetime.now().isoformat(timespec="seconds"), nombre, documento, telefono)
-        )
+        await STORE.insert((datetime.now().isoformat(timespec="seconds"), nombre, documento, telefono))
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
 
 @app.get("/admin/fix/list")
-def admin_fix_list(request: Request, k: str | None = None, limit: int = 5):
+async def admin_fix_list(request: Request, k: str | None = None, limit: int = 5):
     _check_admin(request, k)
-    ensure_table()
+    async def build():
+        return {"rows": await STORE.fetch(
+            "SELECT timestamp, nombre, documento, telefono FROM registros ORDER BY id DESC LIMIT ?", (limit,))}
     try:
-        rows = db_query("SELECT timestamp, nombre, documento, telefono FROM registros ORDER BY id DESC LIMIT ?", (limit,))
-        return {"rows": rows}
+        return await cached_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
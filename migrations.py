@@ -0,0 +1,464 @@
+﻿"""Migraciones versionadas del esquema (SQLite y Postgres).
+
+Se ejecutan una sola vez en el arranque (lifespan) y dejan `registros` en el
+esquema canónico, venga de donde venga la base:
+
+  - main.py:            registros(timestamp, nombre, documento, telefono)
+  - db_fix.py:          registros(ts, nombre, documento, telefono)
+  - backups main.py:    registros(nombre, documento, telefono, email, ciudad, vehiculo, ts)
+  - db_init.py (PG):    conductores(nombre, documento, telefono, email, ciudad, tipo_vehiculo, ts)
+
+Uso: migrate(con) con una conexión DB-API en autocommit
+(sqlite3 con isolation_level=None, psycopg con autocommit=True).
+"""
+from datetime import datetime
+
+# Columnas canónicas (además de id). Todas TEXT NOT NULL DEFAULT '' salvo timestamp.
+COLUMNS = ["timestamp", "nombre", "documento", "telefono", "email", "ciudad", "vehiculo", "ip"]
+
+# Alias de columnas de esquemas anteriores -> columna canónica
+ALIASES = {"ts": "timestamp", "tipo_vehiculo": "vehiculo"}
+
+_DDL = {
+    "sqlite": """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            documento TEXT NOT NULL DEFAULT '',
+            telefono TEXT NOT NULL DEFAULT '',
+            email TEXT NOT NULL DEFAULT '',
+            ciudad TEXT NOT NULL DEFAULT '',
+            vehiculo TEXT NOT NULL DEFAULT '',
+            ip TEXT NOT NULL DEFAULT ''
+        )""",
+    "postgres": """
+        CREATE TABLE {name} (
+            id BIGSERIAL PRIMARY KEY,
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+            nombre TEXT NOT NULL,
+            documento TEXT NOT NULL DEFAULT '',
+            telefono TEXT NOT NULL DEFAULT '',
+            email TEXT NOT NULL DEFAULT '',
+            ciudad TEXT NOT NULL DEFAULT '',
+            vehiculo TEXT NOT NULL DEFAULT '',
+            ip TEXT NOT NULL DEFAULT ''
+        )""",
+}
+
+
+def dialect_of(con):
+    return "sqlite" if type(con).__module__.startswith("sqlite3") else "postgres"
+
+
+# --- introspección ---
+def _columns(con, table, dialect):
+    if dialect == "sqlite":
+        return [r[1] for r in con.execute(f"PRAGMA table_info({table})").fetchall()]
+    cur = con.cursor()
+    cur.execute("SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+                (table,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _exec(con, sql):
+    if hasattr(con, "execute"):
+        return con.execute(sql)
+    cur = con.cursor()
+    cur.execute(sql)
+    return cur
+
+
+def _scalar(con, sql):
+    row = _exec(con, sql).fetchone()
+    return row[0] if row else None
+
+
+def _copy_into(con, dialect, src, dst, src_cols):
+    """INSERT INTO dst SELECT ... FROM src, mapeando alias y rellenando vacíos."""
+    mapped = {ALIASES.get(c, c): c for c in src_cols}
+    # mismo formato que escribe la app (ISO con 'T', sin zona); en Postgres la columna es TIMESTAMP
+    now = "strftime('%Y-%m-%dT%H:%M:%S', 'now')" if dialect == "sqlite" else "LOCALTIMESTAMP(0)"
+    cols, exprs = [], []
+    if "id" in src_cols:
+        cols.append("id"); exprs.append("id")
+    for c in COLUMNS:
+        if c not in mapped:
+            continue
+        cols.append(c)
+        if c == "timestamp":
+            if dialect == "sqlite":
+                exprs.append(f"COALESCE({mapped[c]}, {now})")
+            else:
+                # el origen puede ser TEXT (esquemas viejos) o TIMESTAMP[TZ]: se castea explícito
+                exprs.append(f"COALESCE(NULLIF({mapped[c]}::text, '')::timestamp, {now})")
+        else:
+            cast = "" if dialect == "sqlite" else "::text"
+            exprs.append(f"COALESCE({mapped[c]}{cast}, '')")
+    if "timestamp" not in cols:
+        cols.append("timestamp")
+        exprs.append(now)
+    if "nombre" not in cols:
+        cols.append("nombre"); exprs.append("''")
+    _exec(con, f"INSERT INTO {dst} ({', '.join(cols)}) SELECT {', '.join(exprs)} FROM {src}")
+
+
+def _fix_sequence(con, dialect, table):
+    if dialect == "postgres":
+        _exec(con, f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                   f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)")
+
+
+# --- migraciones ---
+def m001_registros_canonico(con, dialect):
+    cols = _columns(con, "registros", dialect)
+    if not cols:
+        _exec(con, _DDL[dialect].format(name="registros"))
+    elif cols != ["id"] + COLUMNS:
+        # reconstruir: crear tabla canónica, copiar (conservando id), reemplazar
+        _exec(con, _DDL[dialect].format(name="registros_v1"))
+        _copy_into(con, dialect, "registros", "registros_v1", cols)
+        _exec(con, "DROP TABLE registros")
+        _exec(con, "ALTER TABLE registros_v1 RENAME TO registros")
+        _fix_sequence(con, dialect, "registros")
+    # datos de la tabla Postgres 'conductores' (db_init.py): se copian una vez, sin ids
+    legacy = _columns(con, "conductores", dialect)
+    if legacy:
+        _copy_into(con, dialect, "conductores", "registros", [c for c in legacy if c != "id"])
+
+
+# Columnas indexadas para la búsqueda de texto del admin
+FTS_COLUMNS = ["nombre", "documento", "telefono", "email", "ciudad"]
+
+
+def m002_busqueda_fts(con, dialect):
+    if dialect == "postgres":
+        # equivalente en Postgres: índice GIN sobre el tsvector de las mismas columnas
+        doc = " || ' ' || ".join(FTS_COLUMNS)
+        _exec(con, f"CREATE INDEX IF NOT EXISTS registros_fts_idx ON registros "
+                   f"USING GIN (to_tsvector('simple', {doc}))")
+        return
+    cols = ", ".join(FTS_COLUMNS)
+    new = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    # tabla FTS5 de contenido externo: el texto vive en registros, el índice en registros_fts
+    _exec(con, f"""CREATE VIRTUAL TABLE IF NOT EXISTS registros_fts USING fts5(
+        {cols}, content='registros', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+    _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_fts_ai AFTER INSERT ON registros BEGIN
+        INSERT INTO registros_fts(rowid, {cols}) VALUES (new.id, {new});
+    END""")
+    _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_fts_ad AFTER DELETE ON registros BEGIN
+        INSERT INTO registros_fts(registros_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+    END""")
+    _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_fts_au AFTER UPDATE ON registros BEGIN
+        INSERT INTO registros_fts(registros_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+        INSERT INTO registros_fts(rowid, {cols}) VALUES (new.id, {new});
+    END""")
+    # indexar lo que ya existe
+    _exec(con, "INSERT INTO registros_fts(registros_fts) VALUES ('rebuild')")
+
+
+# Contadores mantenidos por triggers: (dim, clave) -> n. 'total' usa la clave ''
+COUNT_DIMS = ("total", "dia", "ciudad", "vehiculo")
+
+
+def _dim_key(dim, row, dialect):
+    if dim == "total":
+        return "''"
+    if dim == "dia":
+        return (f"substr({row}.timestamp, 1, 10)" if dialect == "sqlite"
+                else f"to_char({row}.timestamp, 'YYYY-MM-DD')")
+    return f"{row}.{dim}"
+
+
+def _count_stmts(row, delta, dialect):
+    return "\n        ".join(
+        f"INSERT INTO registros_counts (dim, key, n) VALUES ('{dim}', {_dim_key(dim, row, dialect)}, {delta}) "
+        f"ON CONFLICT (dim, key) DO UPDATE SET n = registros_counts.n + ({delta});"
+        for dim in COUNT_DIMS)
+
+
+def m003_contadores(con, dialect):
+    _exec(con, "CREATE TABLE IF NOT EXISTS registros_counts ("
+               "dim TEXT NOT NULL, key TEXT NOT NULL, n BIGINT NOT NULL DEFAULT 0, PRIMARY KEY (dim, key))"
+               + (" WITHOUT ROWID" if dialect == "sqlite" else ""))
+    dims = "timestamp, ciudad, vehiculo"
+    if dialect == "sqlite":
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_counts_ai AFTER INSERT ON registros BEGIN
+        {_count_stmts("new", 1, dialect)}
+    END""")
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_counts_ad AFTER DELETE ON registros BEGIN
+        {_count_stmts("old", -1, dialect)}
+    END""")
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_counts_au AFTER UPDATE OF {dims} ON registros BEGIN
+        {_count_stmts("old", -1, dialect)}
+        {_count_stmts("new", 1, dialect)}
+    END""")
+    else:
+        _exec(con, f"""CREATE OR REPLACE FUNCTION registros_counts_fn() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        {_count_stmts("OLD", -1, dialect)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {_count_stmts("NEW", 1, dialect)}
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""")
+        _exec(con, "DROP TRIGGER IF EXISTS registros_counts_tg ON registros")
+        _exec(con, f"CREATE TRIGGER registros_counts_tg AFTER INSERT OR DELETE OR UPDATE OF {dims} "
+                   f"ON registros FOR EACH ROW EXECUTE FUNCTION registros_counts_fn()")
+    rebuild_counts(con, dialect)
+
+
+def rebuild_counts(con, dialect=None):
+    """Recalcula registros_counts desde cero (backfill de la migración y acción admin)."""
+    dialect = dialect or dialect_of(con)
+    _exec(con, "DELETE FROM registros_counts")
+    for dim in COUNT_DIMS:
+        key = _dim_key(dim, "r", dialect)
+        group = "" if dim == "total" else f" GROUP BY {key}"
+        _exec(con, f"INSERT INTO registros_counts (dim, key, n) "
+                   f"SELECT '{dim}', {key}, COUNT(*) FROM registros r{group}")
+
+
+# Rollups analíticos: conteos por (bucket, ciudad, vehiculo) en tablas por hora y por día
+ROLLUPS = {"hora": 13, "dia": 10}  # tabla rollup_<nombre> -> largo del prefijo ISO del timestamp
+
+
+def _bucket(row, size, dialect):
+    if dialect == "sqlite":
+        return f"substr({row}.timestamp, 1, {size})"
+    fmt = "YYYY-MM-DD\"T\"HH24" if size == 13 else "YYYY-MM-DD"
+    return f"to_char({row}.timestamp, '{fmt}')"
+
+
+def _rollup_stmts(row, delta, dialect):
+    return "\n        ".join(
+        f"INSERT INTO rollup_{name} (bucket, ciudad, vehiculo, n) "
+        f"VALUES ({_bucket(row, size, dialect)}, {row}.ciudad, {row}.vehiculo, {delta}) "
+        f"ON CONFLICT (bucket, ciudad, vehiculo) DO UPDATE SET n = rollup_{name}.n + ({delta});"
+        for name, size in ROLLUPS.items())
+
+
+def m004_rollups(con, dialect):
+    for name in ROLLUPS:
+        _exec(con, f"CREATE TABLE IF NOT EXISTS rollup_{name} ("
+                   "bucket TEXT NOT NULL, ciudad TEXT NOT NULL, vehiculo TEXT NOT NULL, "
+                   "n BIGINT NOT NULL DEFAULT 0, PRIMARY KEY (bucket, ciudad, vehiculo))"
+                   + (" WITHOUT ROWID" if dialect == "sqlite" else ""))
+    dims = "timestamp, ciudad, vehiculo"
+    if dialect == "sqlite":
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS rollups_ai AFTER INSERT ON registros BEGIN
+        {_rollup_stmts("new", 1, dialect)}
+    END""")
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS rollups_ad AFTER DELETE ON registros BEGIN
+        {_rollup_stmts("old", -1, dialect)}
+    END""")
+        _exec(con, f"""CREATE TRIGGER IF NOT EXISTS rollups_au AFTER UPDATE OF {dims} ON registros BEGIN
+        {_rollup_stmts("old", -1, dialect)}
+        {_rollup_stmts("new", 1, dialect)}
+    END""")
+    else:
+        _exec(con, f"""CREATE OR REPLACE FUNCTION rollups_fn() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        {_rollup_stmts("OLD", -1, dialect)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {_rollup_stmts("NEW", 1, dialect)}
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""")
+        _exec(con, "DROP TRIGGER IF EXISTS rollups_tg ON registros")
+        _exec(con, f"CREATE TRIGGER rollups_tg AFTER INSERT OR DELETE OR UPDATE OF {dims} "
+                   f"ON registros FOR EACH ROW EXECUTE FUNCTION rollups_fn()")
+    backfill_rollups(con, dialect)
+
+
+def backfill_rollups(con, dialect=None, chunk=200_000):
+    """Reconstruye los rollups desde registros en bloques de ids (un GROUP BY por bloque)."""
+    dialect = dialect or dialect_of(con)
+    max_id = _scalar(con, "SELECT COALESCE(MAX(id), 0) FROM registros") or 0
+    for name, size in ROLLUPS.items():
+        _exec(con, f"DELETE FROM rollup_{name}")
+        b = _bucket("r", size, dialect)
+        for lo in range(0, max_id, chunk):
+            _exec(con, f"INSERT INTO rollup_{name} (bucket, ciudad, vehiculo, n) "
+                       f"SELECT {b}, r.ciudad, r.vehiculo, COUNT(*) FROM registros r "
+                       f"WHERE r.id > {lo} AND r.id <= {lo + chunk} GROUP BY 1, 2, 3 "
+                       f"ON CONFLICT (bucket, ciudad, vehiculo) DO UPDATE SET n = rollup_{name}.n + excluded.n")
+    return max_id
+
+
+def m005_indices_exportacion(con, dialect):
+    # filtros de exportación: rango de fechas, y ciudad / vehiculo + rango de fechas
+    _exec(con, "CREATE INDEX IF NOT EXISTS registros_ts_idx ON registros (timestamp)")
+    _exec(con, "CREATE INDEX IF NOT EXISTS registros_ciudad_ts_idx ON registros (ciudad, timestamp)")
+    _exec(con, "CREATE INDEX IF NOT EXISTS registros_vehiculo_ts_idx ON registros (vehiculo, timestamp)")
+
+
+def m006_indice_documento(con, dialect):
+    _exec(con, "CREATE INDEX IF NOT EXISTS registros_documento_ts_idx ON registros (documento, timestamp)")
+
+
+# Feed de cambios: una fila por INSERT/UPDATE/DELETE en registros, en orden de commit (seq)
+def m007_feed_cambios(con, dialect):
+    seq = "INTEGER PRIMARY KEY AUTOINCREMENT" if dialect == "sqlite" else "BIGSERIAL PRIMARY KEY"
+    _exec(con, f"CREATE TABLE IF NOT EXISTS registros_changes ("
+               f"seq {seq}, op TEXT NOT NULL, registro_id BIGINT NOT NULL)")
+    if dialect == "sqlite":
+        for suffix, event, op, row in (("ai", "INSERT", "insert", "new"), ("au", "UPDATE", "update", "new"),
+                                       ("ad", "DELETE", "delete", "old")):
+            _exec(con, f"""CREATE TRIGGER IF NOT EXISTS registros_changes_{suffix} AFTER {event} ON registros BEGIN
+        INSERT INTO registros_changes (op, registro_id) VALUES ('{op}', {row}.id);
+    END""")
+    else:
+        _exec(con, """CREATE OR REPLACE FUNCTION registros_changes_fn() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+        INSERT INTO registros_changes (op, registro_id) VALUES ('delete', OLD.id);
+        ELSE
+        INSERT INTO registros_changes (op, registro_id) VALUES (lower(TG_OP), NEW.id);
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""")
+        _exec(con, "DROP TRIGGER IF EXISTS registros_changes_tg ON registros")
+        _exec(con, "CREATE TRIGGER registros_changes_tg AFTER INSERT OR DELETE OR UPDATE "
+                   "ON registros FOR EACH ROW EXECUTE FUNCTION registros_changes_fn()")
+    # lo que ya existe entra al feed como inserts, en orden de id
+    _exec(con, "INSERT INTO registros_changes (op, registro_id) SELECT 'insert', id FROM registros ORDER BY id")
+
+
+# Aviso de cambios entre procesos. SQLite: no hace falta (PRAGMA data_version).
+# Postgres: NOTIFY registros_changes al confirmar; un trigger por sentencia y payload
+# fijo, así una transacción avisa una sola vez aunque toque muchas filas.
+def m008_aviso_cambios(con, dialect):
+    if dialect == "sqlite":
+        return
+    _exec(con, """CREATE OR REPLACE FUNCTION registros_changes_notify_fn() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('registros_changes', '');
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""")
+    _exec(con, "DROP TRIGGER IF EXISTS registros_changes_notify_tg ON registros_changes")
+    _exec(con, "CREATE TRIGGER registros_changes_notify_tg AFTER INSERT ON registros_changes "
+               "FOR EACH STATEMENT EXECUTE FUNCTION registros_changes_notify_fn()")
+
+
+# Orden de commit en Postgres: id y seq salen de secuencias (nextval al insertar, no al confirmar),
+# así que dos transacciones pueden confirmar en otro orden y un lector que sigue "id > último" /
+# "seq > cursor" se saltaría la que confirmó tarde. Un lock de transacción tomado ANTES de
+# asignar filas (trigger BEFORE por sentencia) serializa a los escritores hasta su COMMIT:
+# id y seq quedan en orden de commit (lo mismo que da el writer único de SQLite).
+FEED_LOCK_KEY = 0x5354524C  # "STRL"
+
+
+def m009_orden_commit(con, dialect):
+    if dialect == "sqlite":
+        return
+    _exec(con, f"""CREATE OR REPLACE FUNCTION registros_write_lock_fn() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({FEED_LOCK_KEY});
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""")
+    _exec(con, "DROP TRIGGER IF EXISTS registros_write_lock_tg ON registros")
+    _exec(con, "CREATE TRIGGER registros_write_lock_tg BEFORE INSERT OR UPDATE OR DELETE ON registros "
+               "FOR EACH STATEMENT EXECUTE FUNCTION registros_write_lock_fn()")
+
+
+# Época de mantenimiento: recalcular contadores o rollups cambia datos derivados sin tocar
+# registros (ni el feed). Vive en la DB para que la vean todos los workers (WriteClock.refresh
+# por PRAGMA data_version; en Postgres, el mismo NOTIFY registros_changes).
+def m010_epoca_mantenimiento(con, dialect):
+    _exec(con, "CREATE TABLE IF NOT EXISTS registros_meta (key TEXT PRIMARY KEY, value BIGINT NOT NULL DEFAULT 0)")
+    _exec(con, "INSERT INTO registros_meta (key, value) VALUES ('epoch', 0) ON CONFLICT (key) DO NOTHING")
+    if dialect == "postgres":
+        _exec(con, "DROP TRIGGER IF EXISTS registros_meta_notify_tg ON registros_meta")
+        _exec(con, "CREATE TRIGGER registros_meta_notify_tg AFTER INSERT OR UPDATE ON registros_meta "
+                   "FOR EACH STATEMENT EXECUTE FUNCTION registros_changes_notify_fn()")
+
+
+def bump_epoch(con):
+    """Sube la época de mantenimiento (en la misma transacción que el recálculo) y anota la hora."""
+    _exec(con, "UPDATE registros_meta SET value = value + 1 WHERE key = 'epoch'")
+    _exec(con, f"INSERT INTO registros_meta (key, value) VALUES ('epoch_at', CAST({NOW_SQL[dialect_of(con)]} * 1000 AS BIGINT)) "
+               "ON CONFLICT (key) DO UPDATE SET value = excluded.value")
+
+
+# Hora de cada cambio (epoch en segundos, con fracción), con el reloj de la base: de ahí sale
+# Last-Modified, igual en todos los workers (la hora de arranque de cada proceso no sirve).
+NOW_SQL = {"sqlite": "((julianday('now') - 2440587.5) * 86400.0)",
+           "postgres": "extract(epoch FROM clock_timestamp())"}
+
+
+def m011_hora_cambios(con, dialect):
+    if "changed_at" not in _columns(con, "registros_changes", dialect):
+        _exec(con, "ALTER TABLE registros_changes ADD COLUMN changed_at DOUBLE PRECISION")
+    if dialect == "sqlite":
+        # SQLite no acepta un DEFAULT no constante en ADD COLUMN: lo ponen los triggers del feed
+        for suffix, event, op, row in (("ai", "INSERT", "insert", "new"), ("au", "UPDATE", "update", "new"),
+                                       ("ad", "DELETE", "delete", "old")):
+            _exec(con, f"DROP TRIGGER IF EXISTS registros_changes_{suffix}")
+            _exec(con, f"""CREATE TRIGGER registros_changes_{suffix} AFTER {event} ON registros BEGIN
+        INSERT INTO registros_changes (op, registro_id, changed_at) VALUES ('{op}', {row}.id, {NOW_SQL[dialect]});
+    END""")
+    else:
+        # SET DEFAULT aparte: las filas existentes no se reescriben
+        _exec(con, f"ALTER TABLE registros_changes ALTER COLUMN changed_at SET DEFAULT {NOW_SQL[dialect]}")
+    # lo ya existente queda sin hora salvo el último cambio (Last-Modified desde ya)
+    _exec(con, f"UPDATE registros_changes SET changed_at = {NOW_SQL[dialect]} "
+               "WHERE seq = (SELECT MAX(seq) FROM registros_changes)")
+
+
+MIGRATIONS = [
+    (1, "registros canónico", m001_registros_canonico),
+    (2, "búsqueda de texto (FTS5)", m002_busqueda_fts),
+    (3, "contadores por triggers", m003_contadores),
+    (4, "rollups por hora y día", m004_rollups),
+    (5, "índices para exportaciones filtradas", m005_indices_exportacion),
+    (6, "índice por documento", m006_indice_documento),
+    (7, "feed de cambios", m007_feed_cambios),
+    (8, "aviso de cambios (NOTIFY)", m008_aviso_cambios),
+    (9, "ids y feed en orden de commit", m009_orden_commit),
+    (10, "época de mantenimiento", m010_epoca_mantenimiento),
+    (11, "hora de cada cambio", m011_hora_cambios),
+]
+
+
+def current_version(con, dialect=None):
+    dialect = dialect or dialect_of(con)
+    if not _columns(con, "schema_version", dialect):
+        return 0
+    return _scalar(con, "SELECT COALESCE(MAX(version), 0) FROM schema_version") or 0
+
+
+def migrate(con, target=None):
+    """Aplica las migraciones pendientes; cada una en su propia transacción. Devuelve la versión final."""
+    dialect = dialect_of(con)
+    _exec(con, "CREATE TABLE IF NOT EXISTS schema_version ("
+               "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)")
+    if current_version(con, dialect) >= MIGRATIONS[-1][0]:
+        return MIGRATIONS[-1][0]
+    for version, name, fn in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        # BEGIN IMMEDIATE: si varios procesos arrancan a la vez, sólo uno migra
+        _exec(con, "BEGIN IMMEDIATE" if dialect == "sqlite" else "BEGIN")
+        try:
+            if dialect == "postgres":
+                _exec(con, "LOCK TABLE schema_version IN EXCLUSIVE MODE")
+            if current_version(con, dialect) >= version:
+                _exec(con, "ROLLBACK")
+                continue
+            fn(con, dialect)
+            ts = datetime.now().isoformat(timespec="seconds")
+            name_sql = name.replace("'", "''")
+            _exec(con, f"INSERT INTO schema_version (version, name, applied_at) VALUES ({version}, '{name_sql}', '{ts}')")
+            _exec(con, "COMMIT")
+        except Exception:
+            _exec(con, "ROLLBACK")
+            raise
+    return current_version(con, dialect)
@@ -0,0 +1,110 @@
+﻿"""Lectura de registros para exportaciones: filtros empujados a SQL y keyset en lotes.
+
+Sin filtros se recorre por id (PK); con filtros se recorre por (timestamp, id),
+que es el orden de los índices registros_ts_idx y registros_<columna>_ts_idx
+(ver migrations.m005 / m006): el costo es proporcional a las filas devueltas,
+no al tamaño de la tabla.
+
+Las lecturas van contra un storage (storage.py: SQLite o Postgres) con
+placeholders '?'.
+"""
+
+import base64
+
+EXPORT_COLUMNS = ["id", "timestamp", "nombre", "documento", "telefono", "email", "ciudad", "vehiculo"]
+
+
+def _ts_bound(prefix):
+    # Postgres compara timestamps, no texto: "2025-01" -> "2025-01-01T00:00:00" (mismo corte que el prefijo)
+    return prefix + "0001-01-01T00:00:00"[len(prefix):]
+
+
+def build_filters(since=None, until=None, ciudad=None, vehiculo=None, documento=None, dialect="sqlite"):
+    """(where, params) para [since, until) y valores exactos de ciudad / vehiculo / documento."""
+    bound = _ts_bound if dialect == "postgres" else str
+    where, params = [], []
+    if since:
+        where.append("timestamp >= ?"); params.append(bound(since))
+    if until:
+        where.append("timestamp < ?"); params.append(bound(until))
+    if ciudad:
+        where.append("ciudad = ?"); params.append(ciudad)
+    if vehiculo:
+        where.append("vehiculo = ?"); params.append(vehiculo)
+    if documento:
+        where.append("documento = ?"); params.append(documento)
+    return where, params
+
+
+def parse_fields(fields, allowed=EXPORT_COLUMNS, default=EXPORT_COLUMNS):
+    """?fields=a,b,c -> lista validada (ValueError si hay columnas desconocidas)."""
+    if not fields:
+        return list(default)
+    out = [f.strip() for f in fields.split(",") if f.strip()]
+    bad = [f for f in out if f not in allowed]
+    if bad:
+        raise ValueError(f"columnas desconocidas: {', '.join(bad)} (disponibles: {', '.join(allowed)})")
+    return list(dict.fromkeys(out))
+
+
+async def iter_rows(store, cols, where=(), params=(), batch=1000):
+    """Lotes de tuplas (en el orden de cols) hasta el MAX(id) del inicio.
+
+    Una consulta por lote (el storage presta y devuelve la conexión), así una
+    descarga lenta no retiene conexiones; memoria acotada a un lote.
+    """
+    by_ts = bool(where)
+    max_id = await store.fetchval("SELECT COALESCE(MAX(id), 0) FROM registros")
+    cond = " AND ".join(["id <= ?"] + list(where))
+    select = f"SELECT id, timestamp, {', '.join(cols)} FROM registros"
+    if by_ts:
+        # el primer lote va sin cursor: no hace falta un (timestamp, id) "mínimo" válido en cada motor
+        first = f"{select} WHERE {cond} ORDER BY timestamp, id LIMIT ?"
+        sql = f"{select} WHERE (timestamp, id) > (?, ?) AND {cond} ORDER BY timestamp, id LIMIT ?"
+    else:
+        first = sql = f"{select} WHERE id > ? AND {cond} ORDER BY id LIMIT ?"
+    cursor = () if by_ts else (0,)
+    while True:
+        rows = await store.fetchall(sql if cursor else first, (*cursor, max_id, *params, batch))
+        if not rows:
+            break
+        cursor = (rows[-1][1], rows[-1][0]) if by_ts else (rows[-1][0],)
+        yield [r[2:] for r in rows]
+        if len(rows) < batch:
+            break
+
+
+# --- feed de cambios (tabla registros_changes, ver migrations.m007) ---
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(f"c1:{int(seq)}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Cursor opaco -> seq (0 sin cursor); ValueError si no es un cursor válido."""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        tag, _, seq = raw.partition(":")
+        if tag != "c1":
+            raise ValueError
+        return int(seq)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("cursor inválido") from None
+
+
+async def changes_page(store, cols, after_seq=0, limit=1000):
+    """Cambios con seq > after_seq: (cambios, último seq, hay_más, seq máximo actual).
+
+    Para insert/update se devuelve el estado actual de la fila (None si ya se borró;
+    ese delete aparece más adelante en el mismo feed).
+    """
+    max_seq = await store.fetchval("SELECT COALESCE(MAX(seq), 0) FROM registros_changes")
+    rows = await store.fetchall(
+        f"SELECT c.seq, c.op, c.registro_id, r.id, {', '.join('r.' + c for c in cols)} "
+        f"FROM registros_changes c LEFT JOIN registros r ON r.id = c.registro_id AND c.op != 'delete' "
+        f"WHERE c.seq > ? ORDER BY c.seq LIMIT ?", (after_seq, limit + 1))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    out = [{"op": r[1], "id": r[2], "row": dict(zip(cols, r[4:])) if r[3] is not None else None} for r in rows]
+    return out, (rows[-1][0] if rows else after_seq), more, max_seq
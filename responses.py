@@ -0,0 +1,183 @@
+﻿import hashlib, os, time
+
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
+from starlette.responses import Response
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _http_date(modified_at):
+    """Last-Modified para modified_at (epoch con fracción), o None si aún no es definitivo.
+
+    Las fechas HTTP van en segundos enteros: se anuncia el final del segundo de la
+    modificación y sólo cuando ese segundo ya pasó; así una escritura posterior cae
+    siempre en o después de la fecha anunciada (RFC 9110 8.8.2.2).
+    """
+    if modified_at is None or time.time() < int(modified_at) + 1:
+        return None
+    return formatdate(int(modified_at) + 1, usegmt=True)
+
+
+def is_not_modified(headers, etag, modified_at=None):
+    """GET condicional: If-None-Match (comparación débil) y, si no viene, If-Modified-Since.
+
+    If-Modified-Since se compara con la hora exacta (no redondeada): una modificación en
+    el mismo segundo que la fecha del header no da 304.
+    """
+    inm = headers.get("if-none-match")
+    if inm is not None:
+        tags = {_opaque(t) for t in inm.split(",")}
+        return "*" in tags or _opaque(etag) in tags
+    ims = headers.get("if-modified-since")
+    if ims and modified_at is not None:
+        try:
+            return modified_at < parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def validator_headers(etag, modified_at=None):
+    out = {"ETag": etag}
+    last_modified = _http_date(modified_at)
+    if last_modified:
+        out["Last-Modified"] = last_modified
+    return out
+
+
+def not_modified(etag, modified_at=None):
+    return Response(status_code=304, headers=validator_headers(etag, modified_at))
+
+
+def file_etag(st):
+    # mismo formato que FileResponse (tamaño+mtime): los ETags ya emitidos siguen valiendo
+    base = f"{st.st_mtime}-{st.st_size}".encode()
+    return f'"{hashlib.md5(base, usedforsecurity=False).hexdigest()}"'
+
+
+class FileSnapshot:
+    """Foto de un archivo que sólo crece (append), como registro.csv.
+
+    Se abre el archivo y se toma fstat del mismo fd: los bytes [0, size) ya no cambian
+    aunque el archivo siga creciendo, y una reconstrucción (os.replace, inode nuevo)
+    no afecta al fd abierto. Con stat_result (tomado antes, p. ej. para ETag/304 sin
+    abrir nada) la foto es esa si el fd es el mismo archivo. El fd se cierra al terminar
+    de leer o al liberar la foto.
+    """
+
+    def __init__(self, path, stat_result=None, chunk_size=64 * 1024):
+        self.file = open(path, "rb", buffering=0)
+        st = os.fstat(self.file.fileno())
+        if stat_result is not None and st.st_ino == stat_result.st_ino and st.st_size >= stat_result.st_size:
+            st = stat_result  # mismo inode, sólo creció: el prefijo del stat previo no cambió
+        self.stat = st
+        self.size = st.st_size
+        self.modified_at = st.st_mtime
+        self.etag = file_etag(st)
+        self.chunk_size = chunk_size
+
+    def _read_at(self, offset, n):
+        self.file.seek(offset)
+        return self.file.read(n)
+
+    async def chunks(self, start=0, end=None):
+        """Bytes [start, end) de la foto; nunca pasa de size."""
+        end = self.size if end is None else min(end, self.size)
+        try:
+            while start < end:
+                chunk = await anyio.to_thread.run_sync(self._read_at, start, min(self.chunk_size, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                yield chunk
+        finally:
+            self.file.close()
+
+    def close(self):
+        self.file.close()
+
+
+def _byte_range(value, size):
+    """Un solo rango `bytes=a-b` / `a-` / `-n` → (start, end) semiabierto; None si no es
+    satisfacible; (0, size) si hay que servir el archivo completo (varios rangos, otra unidad)."""
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return 0, size
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep:
+            return 0, size
+        if first == "":
+            n = int(last)
+            return (max(size - n, 0), size) if n > 0 and size > 0 else None
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return 0, size
+    if start < 0 or start >= size or end <= start:
+        return None
+    return start, end
+
+
+def _if_range_ok(value, etag, modified_at):
+    # If-Range: el rango sólo vale si el validador coincide (ETag fuerte o fecha exacta)
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag
+    return value == _http_date(modified_at)
+
+
+class SnapshotFileResponse(Response):
+    """Bytes [start, end) de una FileSnapshot, con los headers ya armados.
+
+    Si el servidor ofrece la extensión ASGI `http.response.zerocopysend` (fd + offset +
+    count) el envío es sendfile acotado a la foto; si no, lectura por bloques en un hilo.
+    `http.response.pathsend` no se usa: manda el archivo entero tal como esté al enviarse,
+    y registro.csv puede haber crecido desde el stat (Content-Length quedaría corto).
+    """
+
+    def __init__(self, snap, start, end, status_code=200, headers=None, media_type=None):
+        self.snap, self.start, self.end = snap, start, end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        try:
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": self.snap.file,
+                            "offset": self.start, "count": self.end - self.start, "more_body": False})
+            else:
+                async for chunk in self.snap.chunks(self.start, self.end):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.snap.close()
+
+
+def snapshot_response(snap, request_headers, media_type, headers=None):
+    """Respuesta sobre la foto con Content-Length, ETag, Last-Modified y Range/If-Range."""
+    out = {**validator_headers(snap.etag, snap.modified_at), "Accept-Ranges": "bytes", **(headers or {})}
+    start, end, status = 0, snap.size, 200
+    rng = request_headers.get("range")
+    if rng and _if_range_ok(request_headers.get("if-range"), snap.etag, snap.modified_at):
+        r = _byte_range(rng, snap.size)
+        if r is None:
+            snap.close()
+            out["Content-Range"] = f"bytes */{snap.size}"
+            return Response(status_code=416, headers=out)
+        if r != (0, snap.size):
+            (start, end), status = r, 206
+            out["Content-Range"] = f"bytes {start}-{end - 1}/{snap.size}"
+    out["Content-Length"] = str(end - start)
+    return SnapshotFileResponse(snap, start, end, status_code=status, headers=out, media_type=media_type)
@@ -0,0 +1,38 @@
+﻿"""Consultas sobre los rollups por hora/día (tablas rollup_hora y rollup_dia, ver migrations.m004)."""
+from migrations import ROLLUPS, backfill_rollups, bump_epoch
+
+GROUP_COLUMNS = ("ciudad", "vehiculo")
+BUCKET_ALIASES = {"hour": "hora", "hora": "hora", "day": "dia", "dia": "dia"}
+
+
+async def stats(store, bucket="dia", since=None, until=None, group_by=()):
+    """Registros por bucket (y opcionalmente por ciudad/vehiculo) en [since, until).
+
+    since/until son prefijos ISO (2025-01-31, 2025-01-31T08...); se comparan contra el bucket.
+    """
+    name = BUCKET_ALIASES.get(bucket)
+    if name is None:
+        raise ValueError(f"bucket inválido: {bucket} (hour|day)")
+    group_by = [g for g in group_by if g]
+    bad = [g for g in group_by if g not in GROUP_COLUMNS]
+    if bad:
+        raise ValueError(f"group_by inválido: {', '.join(bad)} ({'|'.join(GROUP_COLUMNS)})")
+    size = ROLLUPS[name]
+    where, params = [], []
+    if since:
+        where.append("bucket >= ?"); params.append(since[:size])
+    if until:
+        where.append("bucket < ?"); params.append(until[:size])
+    cols = ["bucket"] + group_by
+    sql = (f"SELECT {', '.join(cols)}, SUM(n) FROM rollup_{name}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + f" GROUP BY {', '.join(cols)} HAVING SUM(n) != 0 ORDER BY {', '.join(cols)}")
+    rows = await store.fetchall(sql, params)
+    return [dict(zip(cols + ["n"], r[:-1] + (int(r[-1]),))) for r in rows]
+
+
+def backfill(con):
+    """Reconstruye rollup_hora y rollup_dia desde el historial de registros."""
+    max_id = backfill_rollups(con)
+    bump_epoch(con)  # ETag y cachés de todos los workers
+    return max_id
@@ -0,0 +1,87 @@
+﻿"""Búsqueda de texto sobre registros (FTS5 en SQLite, tsvector en Postgres).
+
+Reconstrucción del índice en un paso (p. ej. tras cargar datos por fuera de la app):
+
+    python search.py rebuild [ruta.db]
+"""
+import os, re, sys
+from migrations import FTS_COLUMNS, dialect_of
+
+RESULT_COLUMNS = ["id", "timestamp", "nombre", "documento", "telefono", "email", "ciudad", "vehiculo"]
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# prefijos cortos ("a"*, "31"*) pueden coincidir con casi toda la tabla: se rankean
+# sólo los SEARCH_CANDIDATES más recientes en vez de calcular bm25 para todos
+SHORT_PREFIX = 3
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "5000"))
+
+
+def tokens(q):
+    return _TOKEN.findall(q or "")[:8]
+
+
+def fts_query(q):
+    # cada palabra como prefijo ("ana"* "310"*), todas requeridas; sin operadores del usuario
+    return " ".join(f'"{t}"*' for t in tokens(q))
+
+
+async def search(store, q, limit=20):
+    """Filas que contienen todas las palabras de q (como prefijo), ordenadas por relevancia.
+
+    El ranking y el LIMIT van en una subconsulta sólo sobre el índice; a registros se
+    une únicamente el top-N.
+    """
+    words = tokens(q)
+    if not words:
+        return []
+    cols = ", ".join(f"r.{c}" for c in RESULT_COLUMNS)
+    short = min(len(t) for t in words) < SHORT_PREFIX
+    if store.dialect == "sqlite":
+        match, params = "registros_fts MATCH ?", [fts_query(q)]
+        if short:
+            # sólo los rowid desde el N-ésimo match más reciente (FTS5 filtra rangos de rowid)
+            match += (" AND rowid >= COALESCE((SELECT rowid FROM registros_fts WHERE registros_fts MATCH ? "
+                      f"ORDER BY rowid DESC LIMIT 1 OFFSET {SEARCH_CANDIDATES - 1}), 0)")
+            params.append(fts_query(q))
+        return await store.fetch(
+            f"SELECT {cols}, top.rank FROM ("
+            f"SELECT rowid AS id, bm25(registros_fts) AS rank FROM registros_fts "
+            f"WHERE {match} ORDER BY rank LIMIT ?) top "
+            f"JOIN registros r ON r.id = top.id ORDER BY top.rank",
+            (*params, limit))
+    doc = " || ' ' || ".join(f"c.{c}" for c in FTS_COLUMNS)
+    tsq = " & ".join(f"{t}:*" for t in words)
+    cand = f"ORDER BY c.id DESC LIMIT {SEARCH_CANDIDATES}" if short else ""
+    return await store.fetch(
+        f"SELECT {cols}, top.rank FROM ("
+        f"SELECT id, -ts_rank(vec, to_tsquery('simple', ?)) AS rank FROM ("
+        f"SELECT c.id, to_tsvector('simple', {doc}) AS vec FROM registros c "
+        f"WHERE to_tsvector('simple', {doc}) @@ to_tsquery('simple', ?) {cand}) m "
+        f"ORDER BY rank LIMIT ?) top "
+        f"JOIN registros r ON r.id = top.id ORDER BY top.rank",
+        (tsq, tsq, limit))
+
+
+def rebuild(con):
+    """Regenera el índice completo desde registros; devuelve filas indexadas."""
+    if dialect_of(con) == "sqlite":
+        con.execute("INSERT INTO registros_fts(registros_fts) VALUES ('rebuild')")
+        return con.execute("SELECT COUNT(*) FROM registros").fetchone()[0]
+    cur = con.cursor()
+    cur.execute("REINDEX INDEX registros_fts_idx")
+    cur.execute("SELECT COUNT(*) FROM registros")
+    return cur.fetchone()[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        raise SystemExit("uso: python search.py rebuild [ruta.db]")
+    import db_fix, migrations, time
+    mgr = db_fix.get_manager(sys.argv[2] if len(sys.argv) > 2 else db_fix.app_sqlite_path())
+    with mgr.write() as con:
+        migrations.migrate(con)
+        t0 = time.perf_counter()
+        n = rebuild(con)
+    mgr.close()
+    print(f"índice FTS reconstruido: {n} filas en {time.perf_counter() - t0:.2f}s ({mgr.path})")
@@ -0,0 +1,62 @@
+﻿"""Arranque de producción: migra una vez y levanta N workers de uvicorn sobre main:app.
+
+    python serve.py                      # WEB_CONCURRENCY o un worker por núcleo
+    python serve.py --workers 4 --port 8000
+
+Estado compartido entre workers: la DB (SQLite WAL: un writer a la vez entre
+procesos con BEGIN IMMEDIATE + busy_timeout; o Postgres con DATABASE_URL, un
+pool por worker), registro.csv (lock de archivo + cursor .hwm, ver csv_export) y
+la versión de datos (WriteClock.refresh sobre PRAGMA data_version, o NOTIFY en
+Postgres), de la que salen ETag (junto con STARLINX_DEPLOY_TOKEN, que se genera acá
+una vez para todos) e invalidación del caché de cada worker.
+/admin/stream sigue la DB, así que ve las escrituras de todos. Las
+métricas (/admin/metrics, /admin/db-writer, /admin/cache) son por proceso.
+"""
+import argparse, multiprocessing, os, secrets, sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    return int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def migrate():
+    # una sola vez antes de lanzar los workers (cada lifespan lo vuelve a mirar, ya sin trabajo)
+    import asyncio
+    import main as app
+    app.DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+    async def run():
+        try:
+            return await app.STORE.migrate()
+        finally:
+            await app.STORE.close()
+    return asyncio.run(run())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", type=int, default=default_workers())
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = ap.parse_args(argv)
+
+    import uvicorn
+    # un token por arranque, heredado por todos los workers: mismo ETag en todos, distinto en cada deploy
+    os.environ.setdefault("STARLINX_DEPLOY_TOKEN", secrets.token_hex(4))
+    workers = max(1, args.workers)
+    if workers == 1:
+        version = migrate()
+    else:
+        # en un proceso aparte: el supervisor no carga la app (serían N+1 copias en memoria)
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as ex:
+            version = ex.submit(migrate).result()
+    print(f"[serve] esquema v{version}, {workers} worker(s) en {args.host}:{args.port}", file=sys.stderr)
+    # con workers=1 uvicorn corre en este mismo proceso (sin supervisor)
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+﻿"""Backend de almacenamiento de la app: SQLite (archivo local) o Postgres, según DATABASE_URL.
+
+DATABASE_URL se interpreta como en db_fix._db_from_env: sin valor o sqlite:///ruta ->
+SQLiteStore; postgres://... / postgresql://... -> PostgresStore. Misma interfaz para
+los handlers, todo con await (ninguna consulta bloquea el loop ni un hilo del worker
+esperando la red):
+
+    fetch(sql, params)     -> [dict]      fetchall(sql, params) -> [tuple]
+    fetchval(sql, params)  -> valor       insert(row)           -> confirmado (commit)
+    maintain(fn, *args, write=False)      fn(con, *args) con una conexión síncrona (migraciones,
+                                          verify/rebuild de contadores, backfill, FTS)
+
+El SQL va con placeholders '?' (PostgresStore los traduce a %s).
+
+SQLite: lecturas en hilos sobre el pool read-only (db_pool) e INSERTs por el
+BatchWriter (group commit). Postgres: pool asíncrono de psycopg 3 (PG_POOL_MIN /
+PG_POOL_MAX conexiones, sentencias preparadas a partir de PG_PREPARE_THRESHOLD usos
+por conexión) y aviso de cambios entre procesos con LISTEN/NOTIFY (migrations.m008);
+los escritores se serializan hasta el commit (migrations.m009), así id y seq crecen en
+orden de commit y seguir "id > último" / "seq > cursor" no se salta filas.
+
+Probar contra un Postgres local:
+    DATABASE_URL=postgresql://postgres@localhost/starlinx python serve.py
+"""
+import asyncio, os, re, sys, threading
+from contextlib import contextmanager
+import db_fix, migrations
+from db_writer import BatchWriter
+
+INSERT_REGISTRO = "INSERT INTO registros (timestamp, nombre, documento, telefono) VALUES (?, ?, ?, ?)"
+VERSION_SQL = ("SELECT (SELECT COALESCE(MAX(seq), 0) FROM registros_changes), "
+               "(SELECT COALESCE(MAX(id), 0) FROM registros), "
+               "(SELECT COALESCE(MAX(value), 0) FROM registros_meta WHERE key = 'epoch'), "
+               # hora del último cambio o recálculo (migrations.m011): Last-Modified común a los workers
+               "(SELECT MAX(t) FROM (SELECT (SELECT changed_at FROM registros_changes ORDER BY seq DESC LIMIT 1) AS t "
+               "UNION ALL SELECT value / 1000.0 FROM registros_meta WHERE key = 'epoch_at') AS m)")
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+# pool síncrono aparte para read() (CsvExporter y otros hilos); se abre con el primer uso
+PG_SYNC_POOL_MAX = int(os.getenv("PG_SYNC_POOL_MAX", "4"))
+# usos de una misma sentencia (por conexión) antes de prepararla en el servidor; "none" = nunca
+PG_PREPARE_THRESHOLD = os.getenv("PG_PREPARE_THRESHOLD", "5")
+
+
+def from_env(sqlite_path, flush_ms=5.0, max_batch=256):
+    """Store según DATABASE_URL; sin ella, SQLite en sqlite_path."""
+    if not os.getenv("DATABASE_URL", "").strip():
+        return SQLiteStore(sqlite_path, flush_ms, max_batch)
+    driver, url = db_fix._db_from_env()
+    if driver == "sqlite":
+        return SQLiteStore(url, flush_ms, max_batch)
+    if driver == "postgres":
+        return PostgresStore(url)
+    raise RuntimeError(f"Unsupported driver in DATABASE_URL: {driver}")
+
+
+class SQLiteStore:
+    dialect = "sqlite"
+
+    def __init__(self, path, flush_ms=5.0, max_batch=256):
+        self.path = str(path)
+        self.db = db_fix.get_manager(self.path)
+        self.writer = BatchWriter(self.db.write, INSERT_REGISTRO, flush_ms=flush_ms, max_batch=max_batch)
+
+    def add_listener(self, fn):
+        """fn(rows, last_id) tras cada commit de este proceso."""
+        self.writer.add_listener(fn)
+
+    async def open(self):
+        await asyncio.to_thread(self.db.open)
+        self.writer.start()
+
+    async def close(self):
+        await asyncio.to_thread(self.writer.stop)
+        self.db.close()
+
+    def _migrate(self):
+        # migrate() maneja sus propias transacciones
+        with self.db.write() as con:
+            return migrations.migrate(con)
+
+    async def migrate(self):
+        return await asyncio.to_thread(self._migrate)
+
+    def _maintain(self, fn, args, write):
+        if not write:
+            with self.db.read() as con:
+                return fn(con, *args)
+        with self.db.write() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(con, *args)
+                con.execute("COMMIT")
+                return out
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+
+    def read(self):
+        """Conexión read-only del pool para código en hilos (CsvExporter)."""
+        return self.db.read()
+
+    async def maintain(self, fn, *args, write=False):
+        return await asyncio.to_thread(self._maintain, fn, args, write)
+
+    # --- lecturas (pool read-only, en un hilo) ---
+    def _query(self, sql, params, as_dict):
+        with self.db.read() as con:
+            cur = con.execute(sql, params)
+            rows = cur.fetchall()
+            if not as_dict:
+                return rows
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, r)) for r in rows]
+
+    async def fetch(self, sql, params=()):
+        return await asyncio.to_thread(self._query, sql, params, True)
+
+    async def fetchall(self, sql, params=()):
+        return await asyncio.to_thread(self._query, sql, params, False)
+
+    async def fetchval(self, sql, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0][0] if rows else None
+
+    async def insert(self, row):
+        # espera (sin ocupar un hilo) a que el lote quede confirmado. Si el request se cancela
+        # antes del commit, la fila se descarta (BatchWriter._flush); después, ya está escrita
+        await asyncio.wrap_future(self.writer.submit(row))
+
+    # --- versión de datos (WriteClock) ---
+    def _version(self):
+        with self.db.read() as con:
+            return tuple(con.execute(VERSION_SQL).fetchone())
+
+    def probe(self):
+        # PRAGMA data_version: cambia con cada commit de cualquier proceso
+        return self.db.data_version()
+
+    async def bind_clock(self, clock, on_change=None):
+        # on_change no hace falta: los demás procesos se ven sondeando probe() (refresh / HUB.feed)
+        await asyncio.to_thread(clock.attach, self.probe, self._version, os.stat(self.path).st_ino)
+
+    async def refresh(self, clock):
+        await asyncio.to_thread(clock.refresh)
+
+    def stats(self):
+        return {**self.writer.stats(), "pool": self.db.stats()}
+
+    def describe(self):
+        return {"driver": "sqlite", "url": f"sqlite:///{self.path}"}
+
+
+def _pg(sql):
+    # '?' -> %s (el SQL de la app no lleva '?' ni '%' literales)
+    return sql.replace("?", "%s")
+
+
+class _QmarkConnection:
+    """Conexión psycopg síncrona que acepta el SQL de la app ('?'), para código en hilos (CsvExporter)."""
+
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=()):
+        return self.con.execute(_pg(sql), params)
+
+
+class PostgresStore:
+    dialect = "postgres"
+
+    def __init__(self, url, min_size=PG_POOL_MIN, max_size=PG_POOL_MAX, prepare_threshold=PG_PREPARE_THRESHOLD,
+                 timeout=PG_POOL_TIMEOUT):
+        self.url = url
+        self.min_size, self.max_size, self.timeout = int(min_size), max(int(max_size), int(min_size)), float(timeout)
+        self.prepare_threshold = None if str(prepare_threshold).lower() == "none" else int(prepare_threshold)
+        self.pool = None
+        self._listeners = []
+        self._clock = self._on_change = None
+        self._listen_task = None
+        self._sync_pool = None  # ConnectionPool síncrono de read() (hilos)
+        self._sync_lock = threading.Lock()
+        self._notified = 0  # sube con cada NOTIFY (probe del HUB.feed)
+        self.inserts = self.errors = self.notifies = 0
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    # --- ciclo de vida ---
+    @staticmethod
+    def _configure_adapters(adapters):
+        # timestamp -> texto ISO ("2025-01-01T08:00:00"), igual que lo guarda SQLite
+        from psycopg.adapt import Loader
+
+        class IsoTimestamp(Loader):
+            def load(self, data):
+                return bytes(data).decode("ascii").replace(" ", "T", 1)
+
+        adapters.register_loader("timestamp", IsoTimestamp)
+
+    async def _configure(self, con):
+        self._configure_adapters(con.adapters)
+
+    async def open(self):
+        # import perezoso: psycopg sólo hace falta con DATABASE_URL de Postgres
+        from psycopg_pool import AsyncConnectionPool
+        self.pool = AsyncConnectionPool(
+            self.url, min_size=self.min_size, max_size=self.max_size, timeout=self.timeout, open=False,
+            kwargs={"autocommit": True, "prepare_threshold": self.prepare_threshold},
+            configure=self._configure, name="starlinx")
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listen_task = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        with self._sync_lock:
+            if self._sync_pool is not None:
+                self._sync_pool.close()
+                self._sync_pool = None
+
+    def _connect(self):
+        import psycopg
+        con = psycopg.connect(self.url, autocommit=True)
+        self._configure_adapters(con.adapters)
+        return con
+
+    def _maintain(self, fn, args, write):
+        with self._connect() as con:
+            if not write:
+                return fn(con, *args)
+            with con.transaction():
+                return fn(con, *args)
+
+    @contextmanager
+    def read(self):
+        """Conexión síncrona para hilos (como SQLiteManager.read()), de un pool chico propio:
+        varios hilos leen a la vez sin hacer cola detrás de una sola conexión."""
+        with self._sync_lock:
+            if self._sync_pool is None:
+                from psycopg_pool import ConnectionPool
+                self._sync_pool = ConnectionPool(
+                    self.url, min_size=0, max_size=PG_SYNC_POOL_MAX, timeout=self.timeout, open=True,
+                    kwargs={"autocommit": True}, configure=lambda con: self._configure_adapters(con.adapters),
+                    name="starlinx-sync")
+            pool = self._sync_pool
+        with pool.connection() as con:
+            yield _QmarkConnection(con)
+
+    async def maintain(self, fn, *args, write=False):
+        # el código de mantenimiento es síncrono (compartido con scripts): conexión propia en un hilo
+        out = await asyncio.to_thread(self._maintain, fn, args, write)
+        if write and self._clock is not None:
+            self._clock.advance(*await self._version())  # sin esperar el NOTIFY (p. ej. época nueva)
+        return out
+
+    def _migrate(self):
+        with self._connect() as con:
+            return migrations.migrate(con)
+
+    async def migrate(self):
+        return await asyncio.to_thread(self._migrate)
+
+    # --- lecturas ---
+    async def _query(self, sql, params, as_dict):
+        async with self.pool.connection() as con:
+            cur = await con.execute(_pg(sql), params)
+            rows = await cur.fetchall()
+            if not as_dict:
+                return rows
+            cols = [c.name for c in cur.description]
+            return [dict(zip(cols, r)) for r in rows]
+
+    async def fetch(self, sql, params=()):
+        return await self._query(sql, params, True)
+
+    async def fetchall(self, sql, params=()):
+        return await self._query(sql, params, False)
+
+    async def fetchval(self, sql, params=()):
+        rows = await self._query(sql, params, False)
+        return rows[0][0] if rows else None
+
+    async def insert(self, row):
+        """INSERT confirmado (autocommit) de una fila; avisa a los listeners como un lote de uno."""
+        try:
+            async with self.pool.connection() as con:
+                cur = await con.execute(_pg(INSERT_REGISTRO) + " RETURNING id", row)
+                (last_id,) = await cur.fetchone()
+                # seq que el trigger del feed (m007) le dio a este insert, en la misma sesión
+                cur = await con.execute("SELECT seq, changed_at FROM registros_changes "
+                                        "WHERE seq = currval(pg_get_serial_sequence('registros_changes', 'seq'))")
+                seq, changed_at = await cur.fetchone()
+        except Exception:
+            self.errors += 1
+            raise
+        self.inserts += 1
+        if self._clock is not None:
+            self._clock.advance(seq, last_id, None, changed_at)  # read-your-writes sin esperar el NOTIFY
+        for fn in self._listeners:
+            try:
+                fn([tuple(row)], last_id)
+            except Exception:
+                pass
+
+    # --- versión de datos (WriteClock) ---
+    async def _version(self):
+        rows = await self._query(VERSION_SQL, (), False)
+        return tuple(rows[0])
+
+    def probe(self):
+        return self._notified
+
+    async def bind_clock(self, clock, on_change=None):
+        """Versión inicial + una tarea que escucha NOTIFY registros_changes y adelanta el reloj."""
+        self._clock, self._on_change = clock, on_change
+        oid = await self.fetchval("SELECT 'registros_changes'::regclass::oid")
+        clock.attach(tag=oid)
+        clock.advance(*await self._version())
+        self._listen_task = asyncio.create_task(self._listen())
+
+    async def refresh(self, clock):
+        pass  # el reloj lo adelantan insert() y _listen()
+
+    async def _listen(self):
+        import psycopg
+        wake = asyncio.Event()
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.url, autocommit=True) as con:
+                    await con.execute("LISTEN registros_changes")
+                    wake.set()  # (re)conexión: pudo haber cambios sin aviso
+                    reader = asyncio.create_task(self._drain(con, wake))
+                    try:
+                        while True:
+                            await wake.wait()
+                            wake.clear()  # varios NOTIFY seguidos -> una sola consulta
+                            await self._changed()
+                            if reader.done():
+                                reader.result()  # propaga el error de la conexión
+                    finally:
+                        reader.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WARN] LISTEN registros_changes: {type(e).__name__}: {e}", file=sys.stderr)
+                await asyncio.sleep(1)
+
+    async def _drain(self, con, wake):
+        try:
+            async for _ in con.notifies():
+                self.notifies += 1
+                wake.set()
+        finally:
+            wake.set()  # conexión caída: que _listen lo vea y reconecte
+
+    async def _changed(self):
+        self._notified += 1
+        self._clock.advance(*await self._version())
+        if self._on_change is not None:
+            self._on_change()
+
+    def stats(self):
+        return {"driver": "postgres", "inserts": self.inserts, "errors": self.errors, "notifies": self.notifies,
+                "prepare_threshold": self.prepare_threshold,
+                "pool": self.pool.get_stats() if self.pool is not None else None,
+                "sync_pool": self._sync_pool.get_stats() if self._sync_pool is not None else None}
+
+    def describe(self):
+        return {"driver": "postgres", "url": re.sub(r"(://[^:/@]*:)[^@]*@", r"\1***@", self.url)}
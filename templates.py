@@ -0,0 +1,88 @@
+﻿"""Plantillas HTML compiladas una vez: fragmentos ya codificados + valores escapados.
+
+Sintaxis mínima: {{nombre}} se escapa con html.escape(quote=True) al renderizar;
+{{!nombre}} se inserta tal cual. Los valores pasados a Template(...) como
+constantes se resuelven al compilar (CSS compartido, títulos fijos), así
+cada render sólo concatena bytes.
+
+StaticPage guarda una página fija ya codificada con sus variantes gzip y brotli
+(brotli es opcional: módulo `brotli`) y responde con ETag/304 sin recalcular nada.
+"""
+import gzip, hashlib, html, re
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from encoding import negotiate
+from responses import is_not_modified, not_modified, validator_headers
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+_SLOT = re.compile(r"\{\{(!?)(\w+)\}\}")
+
+
+def escape(value):
+    return html.escape(str(value), quote=True)
+
+
+class Template:
+    def __init__(self, source, **consts):
+        self._parts = []  # bytes literales o (nombre, raw)
+        pos = 0
+        text = []
+        for m in _SLOT.finditer(source):
+            text.append(source[pos:m.start()])
+            pos = m.end()
+            raw, name = m.group(1) == "!", m.group(2)
+            if name in consts:
+                text.append(str(consts[name]) if raw else escape(consts[name]))
+                continue
+            self._parts.append("".join(text).encode("utf-8"))
+            self._parts.append((name, raw))
+            text = []
+        text.append(source[pos:])
+        self._parts.append("".join(text).encode("utf-8"))
+        self.slots = [p[0] for p in self._parts if isinstance(p, tuple)]
+
+    def render(self, **ctx):
+        out = []
+        for p in self._parts:
+            if isinstance(p, bytes):
+                out.append(p)
+                continue
+            name, raw = p
+            v = ctx[name]
+            if not raw:
+                out.append(escape(v).encode("utf-8"))
+            else:
+                out.append(v if isinstance(v, bytes) else str(v).encode("utf-8"))  # bytes = fragmento ya renderizado
+        return b"".join(out)
+
+
+class StaticPage:
+    """Página fija: bytes + variantes comprimidas calculadas al crearla."""
+
+    def __init__(self, body, media_type="text/html; charset=utf-8"):
+        self.body = body.encode("utf-8") if isinstance(body, str) else bytes(body)
+        self.media_type = media_type
+        tag = hashlib.sha1(self.body).hexdigest()[:16]
+        self.variants = {None: (self.body, f'"{tag}"')}
+        self.variants["gzip"] = (gzip.compress(self.body, 9, mtime=0), f'"{tag}-gzip"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(self.body, quality=11), f'"{tag}-br"')
+        self.codecs = tuple(c for c in ("br", "gzip") if c in self.variants)
+
+    def response(self, request: Request):
+        codec = negotiate(request.headers.get("accept-encoding"), self.codecs)
+        body, etag = self.variants[codec]
+        if is_not_modified(request.headers, etag, None):
+            resp = not_modified(etag, None)
+            resp.headers["Vary"] = "Accept-Encoding"
+            return resp
+        headers = {**validator_headers(etag), "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if codec:
+            headers["Content-Encoding"] = codec
+        return Response(body, media_type=self.media_type, headers=headers)
@@ -0,0 +1,74 @@
+﻿"""WriteClock: mismo ETag y Last-Modified en dos procesos sobre la misma base SQLite."""
+import asyncio, json, subprocess, sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# otro "worker": abre la base, escribe (o no) y devuelve su ETag
+WORKER = r'''
+import asyncio, json, sys
+import migrations, storage
+from cache import WriteClock
+
+async def main(path, cmd):
+    store, clock = storage.SQLiteStore(path), WriteClock()
+    await store.open()
+    await store.migrate()
+    await store.bind_clock(clock)
+    if cmd == "insert":
+        await store.insert(("2025-03-01T08:15:00", "Ana", "1010", "300"))
+    elif cmd == "epoch":
+        await store.maintain(migrations.bump_epoch, write=True)
+    await store.refresh(clock)
+    await store.close()
+    print(json.dumps([clock.etag(), clock.modified_at]))
+
+asyncio.run(main(*sys.argv[1:]))
+'''
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("STARLINX_DEPLOY_TOKEN", "test")  # como serve.py: un token para todos los workers
+    return str(tmp_path / "starlinx.db")
+
+
+def _worker(path, cmd):
+    out = subprocess.run([sys.executable, "-c", WORKER, path, cmd], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_etag_shared_across_processes(db_path):
+    import storage
+    from cache import WriteClock
+
+    async def check():
+        first = _worker(db_path, "insert")
+        store, clock = storage.SQLiteStore(db_path), WriteClock()
+        await store.open()
+        try:
+            await store.bind_clock(clock)
+            assert [clock.etag(), clock.modified_at] == first
+            gen = clock.generation
+
+            # escritura en otro proceso: refresh() la ve por PRAGMA data_version
+            second = _worker(db_path, "insert")
+            await store.refresh(clock)
+            assert second[0] != first[0]
+            assert [clock.etag(), clock.modified_at] == second
+            assert clock.generation > gen
+
+            # recálculo (época de mantenimiento) sin tocar registros: también cambia el ETag
+            third = _worker(db_path, "epoch")
+            await store.refresh(clock)
+            assert third[0] != second[0] and third[1] >= second[1]
+            assert [clock.etag(), clock.modified_at] == third
+            assert _worker(db_path, "get") == third
+        finally:
+            await store.close()
+
+    asyncio.run(check())
@@ -0,0 +1,116 @@
+﻿"""CsvExporter: cursor (.hwm / .hwm.pending) y orden fsync -> cursor según la durabilidad."""
+import os, sqlite3, sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import csv_append
+from csv_append import CsvAppender
+from csv_export import CsvExporter
+
+
+@pytest.fixture
+def db(tmp_path):
+    con = sqlite3.connect(tmp_path / "t.db", isolation_level=None, check_same_thread=False)
+    con.execute("CREATE TABLE registros (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT)")
+    con.executemany("INSERT INTO registros (nombre) VALUES (?)", [(f"r{i}",) for i in range(25)])
+
+    @contextmanager
+    def read():
+        yield con
+
+    yield con, read
+    con.close()
+
+
+def _exporter(tmp_path, read, durability, events=None):
+    ap = CsvAppender(tmp_path / "registro.csv", durability=durability, fsync_ms=60_000)
+    ex = CsvExporter(ap, read, ["nombre"], batch=10)
+    if events is not None:
+        write_cursor = ex._write_cursor
+        ex._write_cursor = lambda path, last_id, size: (
+            events.append((path.name.split(".", 2)[-1], last_id)), write_cursor(path, last_id, size))
+    return ap, ex
+
+
+@pytest.fixture
+def events(monkeypatch):
+    out = []
+    fsync = os.fsync
+    monkeypatch.setattr(csv_append.os, "fsync", lambda fd: (out.append(("fsync", None)), fsync(fd)))
+    return out
+
+
+def _lines(tmp_path):
+    return (tmp_path / "registro.csv").read_text(encoding="utf-8").splitlines()
+
+
+def test_always_fsyncs_before_each_cursor(tmp_path, db, events):
+    ap, ex = _exporter(tmp_path, db[1], "always", events)
+    assert ex.sync() == 25
+    ap.close()
+    # reconstrucción (encabezado con fsync), luego cada lote: fsync y recién entonces .hwm
+    assert events == [("fsync", None), ("hwm", 0), ("fsync", None), ("hwm", 10),
+                      ("fsync", None), ("hwm", 20), ("fsync", None), ("hwm", 25)]
+
+
+def test_none_writes_cursor_without_fsync(tmp_path, db, events):
+    ap, ex = _exporter(tmp_path, db[1], "none", events)
+    assert ex.sync() == 25
+    ap.close()
+    assert events == [("hwm", 0), ("hwm", 10), ("hwm", 20), ("hwm", 25)]
+
+
+def test_interval_promotes_pending_after_fsync(tmp_path, db, events):
+    ap, ex = _exporter(tmp_path, db[1], "interval", events)
+    assert ex.sync() == 25
+    assert events == [("fsync", None), ("hwm", 0), ("hwm.pending", 10), ("hwm.pending", 20), ("hwm.pending", 25)]
+    assert ex.stats()["hwm"] == 25 and ex.stats()["hwm_durable"] == 0
+    ap.sync()  # lo que hace el flusher cada fsync_ms
+    assert events[-2:] == [("fsync", None), ("hwm", 25)]
+    assert ex.stats()["hwm_durable"] == 25
+    ap.close()
+
+
+def test_cursor_continues_without_duplicates(tmp_path, db):
+    con, read = db
+    ap, ex = _exporter(tmp_path, read, "none")
+    ex.sync()
+    ap.close()
+    con.executemany("INSERT INTO registros (nombre) VALUES (?)", [("x",), ("y",)])
+    ap, ex = _exporter(tmp_path, read, "none")  # otro worker / reinicio: sigue desde .hwm
+    assert ex.sync() == 2
+    assert ex.sync() == 0
+    ap.close()
+    lines = _lines(tmp_path)
+    assert lines[0] == "nombre" and lines[1:] == [f"r{i}" for i in range(25)] + ["x", "y"]
+
+
+def test_recovery_after_crash(tmp_path, db):
+    ap, ex = _exporter(tmp_path, db[1], "interval")
+    ex.sync()
+    ap.close()  # close hace fsync: .hwm = 25
+    # pending que describe más bytes de los que hay (se perdió en un corte): vale .hwm
+    (tmp_path / "registro.csv.hwm.pending").write_text("25 999999", encoding="utf-8")
+    # cola escrita sin cursor (caída entre append y cursor): se corta
+    with open(tmp_path / "registro.csv", "a", encoding="utf-8") as f:
+        f.write("r24\n")
+    ap, ex = _exporter(tmp_path, db[1], "interval")
+    assert ex.sync() == 0
+    ap.close()
+    assert _lines(tmp_path)[1:] == [f"r{i}" for i in range(25)]
+
+
+def test_rebuild_when_file_lost_bytes(tmp_path, db):
+    ap, ex = _exporter(tmp_path, db[1], "none")
+    ex.sync()
+    ap.close()
+    path = tmp_path / "registro.csv"
+    path.write_bytes(path.read_bytes()[:20])  # menos bytes de los que da el cursor
+    ap, ex = _exporter(tmp_path, db[1], "none")
+    assert ex.sync() == 25
+    ap.close()
+    assert _lines(tmp_path)[1:] == [f"r{i}" for i in range(25)]
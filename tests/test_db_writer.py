@@ -0,0 +1,70 @@
+﻿"""BatchWriter sobre SQLite: filas de requests cancelados antes del commit."""
+import sqlite3, sys, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_writer import BatchWriter
+
+SQL = "INSERT INTO registros (nombre) VALUES (?)"
+
+
+@pytest.fixture
+def writer(tmp_path):
+    con = sqlite3.connect(tmp_path / "t.db", isolation_level=None, check_same_thread=False)
+    con.execute("CREATE TABLE registros (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT)")
+
+    @contextmanager
+    def acquire():
+        yield con
+
+    w = BatchWriter(acquire, SQL, flush_ms=1)
+    yield w, con
+    w.stop()
+    con.close()
+
+
+def _item(name):
+    return (name,), Future(), time.perf_counter()
+
+
+def test_cancelled_rows_are_not_written(writer):
+    writer, con = writer
+    seen = []
+    writer.add_listener(lambda rows, last_id: seen.append((rows, last_id)))
+    batch = [_item("a"), _item("b"), _item("c")]
+    batch[1][1].cancel()  # el cliente se desconectó antes del flush
+    writer._flush(batch)
+    assert batch[0][1].result(0) is None and batch[2][1].result(0) is None
+    assert batch[1][1].cancelled()
+    assert con.execute("SELECT nombre FROM registros ORDER BY id").fetchall() == [("a",), ("c",)]
+    assert seen == [([("a",), ("c",)], 2)]
+    assert writer.stats()["rows"] == 2
+
+
+def test_all_cancelled_skips_the_commit(writer):
+    writer, con = writer
+    seen = []
+    writer.add_listener(lambda rows, last_id: seen.append(last_id))
+    batch = [_item("a"), _item("b")]
+    for _, fut, _ in batch:
+        fut.cancel()
+    writer._flush(batch)
+    assert con.execute("SELECT COUNT(*) FROM registros").fetchone()[0] == 0
+    assert seen == [] and writer.stats()["batches"] == 0
+
+
+def test_confirmed_rows_can_no_longer_be_cancelled(writer):
+    writer, con = writer
+    fut = writer.submit(("a",))
+    fut.result(5)
+    assert not fut.cancel()
+    # un lote que falla resuelve todos sus futures con la excepción, el hilo sigue vivo
+    con.execute("DROP TABLE registros")
+    with pytest.raises(sqlite3.OperationalError):
+        writer.write(("b",), timeout=5)
+    assert writer.running
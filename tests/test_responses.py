@@ -0,0 +1,62 @@
+﻿"""Range / If-Range / If-Modified-Since de responses.py (sin servidor)."""
+import sys, time
+from email.utils import formatdate
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from responses import _byte_range, _if_range_ok, is_not_modified, validator_headers
+
+ETAG = '"abc"'
+
+
+def test_byte_range():
+    assert _byte_range("bytes=0-9", 100) == (0, 10)
+    assert _byte_range("bytes=90-", 100) == (90, 100)
+    assert _byte_range("bytes=90-500", 100) == (90, 100)  # el final se recorta al tamaño
+    assert _byte_range("bytes=-10", 100) == (90, 100)
+    assert _byte_range("bytes=-500", 100) == (0, 100)
+    assert _byte_range("Bytes=5-5", 100) == (5, 6)
+
+
+def test_byte_range_unsatisfiable():
+    assert _byte_range("bytes=100-", 100) is None
+    assert _byte_range("bytes=10-5", 100) is None
+    assert _byte_range("bytes=-0", 100) is None
+    assert _byte_range("bytes=-5", 0) is None
+
+
+def test_byte_range_falls_back_to_full_file():
+    # varios rangos, otra unidad o basura: archivo completo (200), nunca 416
+    assert _byte_range("bytes=0-1,5-6", 100) == (0, 100)
+    assert _byte_range("items=0-1", 100) == (0, 100)
+    assert _byte_range("bytes=abc", 100) == (0, 100)
+    assert _byte_range("bytes=a-b", 100) == (0, 100)
+
+
+def test_if_range():
+    old = time.time() - 60
+    assert _if_range_ok(None, ETAG, old)
+    assert _if_range_ok(ETAG, ETAG, old)
+    assert not _if_range_ok('"otro"', ETAG, old)
+    assert not _if_range_ok('W/"abc"', ETAG, old)  # If-Range exige comparación fuerte
+    date = validator_headers(ETAG, old)["Last-Modified"]
+    assert _if_range_ok(date, ETAG, old)
+    assert not _if_range_ok(formatdate(old - 3600, usegmt=True), ETAG, old)
+    # fecha aún no definitiva (modificado en este segundo): el rango no vale
+    now = time.time()
+    assert not _if_range_ok(formatdate(int(now) + 1, usegmt=True), ETAG, now)
+
+
+def test_if_modified_since_same_second():
+    old = time.time() - 60
+    date = validator_headers(ETAG, old)["Last-Modified"]
+    assert is_not_modified({"if-modified-since": date}, ETAG, old)
+    # otra escritura dentro del segundo que anuncia la fecha: no es 304
+    assert not is_not_modified({"if-modified-since": date}, ETAG, int(old) + 1.2)
+    assert not is_not_modified({"if-modified-since": formatdate(int(old), usegmt=True)}, ETAG, old)
+    # Last-Modified sólo se anuncia cuando su segundo ya pasó
+    assert "Last-Modified" not in validator_headers(ETAG, time.time())
+    # If-None-Match manda sobre la fecha
+    assert not is_not_modified({"if-none-match": '"x"', "if-modified-since": date}, ETAG, old)
+    assert is_not_modified({"if-none-match": 'W/"abc", "x"'}, ETAG, None)
@@ -0,0 +1,108 @@
+﻿"""PostgresStore contra un Postgres real (se salta sin STARLINX_TEST_PG_URL).
+
+    STARLINX_TEST_PG_URL=postgresql://postgres@localhost/postgres python -m pytest tests
+
+Cada test corre en un schema propio (search_path) que se borra al terminar.
+"""
+import asyncio, os, sys, time, uuid
+from pathlib import Path
+from urllib.parse import quote
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PG_URL = os.getenv("STARLINX_TEST_PG_URL", "").strip()
+pytestmark = pytest.mark.skipif(not PG_URL, reason="STARLINX_TEST_PG_URL no definida")
+
+ROW = ("2025-03-01T08:15:00", "Ana Pérez", "1010", "3001234567")
+
+
+@pytest.fixture
+def pg_url():
+    psycopg = pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg_pool")
+    schema = f"starlinx_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(PG_URL, autocommit=True) as con:
+        con.execute(f"CREATE SCHEMA {schema}")
+    sep = "&" if "?" in PG_URL else "?"
+    yield f"{PG_URL}{sep}options={quote(f'-c search_path={schema}')}"
+    with psycopg.connect(PG_URL, autocommit=True) as con:
+        con.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _with_store(url, fn):
+    import storage
+    store = storage.PostgresStore(url, min_size=1, max_size=2)
+    await store.open()
+    try:
+        await store.migrate()
+        return await fn(store)
+    finally:
+        await store.close()
+
+
+def test_migrate(pg_url):
+    import migrations
+
+    async def check(store):
+        assert await store.migrate() == migrations.MIGRATIONS[-1][0]  # idempotente
+        return await store.fetchval("SELECT COUNT(*) FROM registros")
+
+    assert run(_with_store(pg_url, check)) == 0
+
+
+def test_insert_fetch_and_placeholders(pg_url):
+    async def check(store):
+        await store.insert(ROW)
+        await store.insert(("2025-03-02T09:00:00", "Luis Gómez", "2020", "3109876543"))
+        # '?' se traduce a %s
+        rows = await store.fetch("SELECT id, nombre, documento FROM registros WHERE documento = ? AND id > ?",
+                                 ("1010", 0))
+        total = await store.fetchval("SELECT n FROM registros_counts WHERE dim = 'total' AND key = ?", ("",))
+        return rows, total
+
+    rows, total = run(_with_store(pg_url, check))
+    assert rows == [{"id": 1, "nombre": "Ana Pérez", "documento": "1010"}]
+    assert total == 2
+
+
+def test_timestamp_loader(pg_url):
+    async def check(store):
+        await store.insert(ROW)
+        async_ts = await store.fetchval("SELECT timestamp FROM registros")
+        with store.read() as con:  # conexión síncrona (CsvExporter)
+            sync_ts = con.execute("SELECT timestamp FROM registros WHERE id = ?", (1,)).fetchone()[0]
+        return async_ts, sync_ts
+
+    assert run(_with_store(pg_url, check)) == (ROW[0], ROW[0])
+
+
+def test_notify_advances_clock(pg_url):
+    import psycopg
+    from cache import WriteClock
+
+    async def check(store):
+        clock = WriteClock()
+        woken = []
+        await store.bind_clock(clock, lambda: woken.append(1))
+        v0, probe0 = clock.version, store.probe()
+        # escritura de "otro worker": sólo se entera por NOTIFY
+        def external():
+            with psycopg.connect(pg_url, autocommit=True) as con:
+                con.execute("INSERT INTO registros (timestamp, nombre) VALUES (%s, %s)", ROW[:2])
+        await asyncio.to_thread(external)
+        deadline = time.monotonic() + 5
+        while clock.version == v0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return v0, clock.version, clock.last_id, probe0, store.probe(), woken
+
+    v0, v1, last_id, probe0, probe1, woken = run(_with_store(pg_url, check))
+    assert v1 > v0
+    assert last_id == 1
+    assert probe1 != probe0
+    assert woken